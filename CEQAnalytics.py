@@ -0,0 +1,203 @@
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from CEQDataset import load_store, category_index
+from CEQParser import CATEGORY_KEYS
+
+# Aggregates over a CEQDataset. Every computation groups rows with np.unique
+# and sums them with np.bincount, so there are no Python loops over rows.
+#
+# For the scale categories value1 is the mean and value2 the standard
+# deviation of the answers. For the pass rate the share of passed students,
+# value2, is used as the mean and it has no standard deviation.
+
+# Table of aggregated results, one array per column
+class Table:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def take(self, rows):
+        return Table({name: column[rows] for name, column in self.columns.items()})
+
+    # Rows sorted on a column, NaN last
+    def sort(self, column, descending=True):
+        values = self.columns[column].astype(float)
+        values = -values if descending else values
+        return self.take(np.argsort(np.where(np.isnan(values), np.inf, values), kind='stable'))
+
+    def head(self, count):
+        return self.take(np.arange(min(count, len(self))))
+
+    def records(self):
+        for i in range(len(self)):
+            yield {name: column[i].item() for name, column in self.columns.items()}
+
+    def to_csv(self, path):
+        f = open(path, 'w', newline='', encoding='utf-8') if path != '-' else sys.stdout
+        try:
+            writer = csv.DictWriter(f, fieldnames=list(self.columns))
+            writer.writeheader()
+            writer.writerows(self.records())
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+# Mean and standard deviation of every row
+def row_stats(dataset):
+    pass_rate = dataset['category'] == 0
+    means = np.where(pass_rate, dataset['value2'], dataset['value1']).astype(float)
+    stds = np.where(pass_rate, 0, dataset['value2']).astype(float)
+    return means, stds
+
+# Respondents of every row, rows of reports that don't give them count as one
+def row_weights(dataset):
+    return np.where(dataset['respondents'] > 0, dataset['respondents'], 1).astype(float)
+
+# Unique values of the given fields and the group of every row
+def group(dataset, fields):
+    keys = np.rec.fromarrays([dataset[field] for field in fields], names=list(fields))
+    groups, inverse = np.unique(keys, return_inverse=True)
+    return {field: groups[field] for field in fields}, inverse.ravel()
+
+def category_names(columns):
+    if 'category' in columns:
+        columns['category'] = np.array(CATEGORY_KEYS)[columns['category']]
+    return columns
+
+# Respondent weighted means and pooled standard deviations of the groups of
+# rows sharing the given fields
+def weighted_means(dataset, by=('course', 'category')):
+    columns, inverse = group(dataset, by)
+    count = len(columns[by[0]])
+    means, stds = row_stats(dataset)
+    weights = row_weights(dataset)
+
+    total = np.bincount(inverse, weights, count)
+    mean = np.bincount(inverse, weights * means, count) / total
+    # Pooled over the groups: the spread within every row plus the spread of
+    # the row means around the group mean
+    squares = (weights - 1) * stds ** 2 + weights * (means - mean[inverse]) ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.where(total > 1, np.sqrt(np.bincount(inverse, squares, count) / (total - 1)), np.nan)
+
+    columns.update(mean=mean, std=std, respondents=total.astype(int),
+                   reports=np.bincount(inverse, minlength=count))
+    return Table(category_names(columns))
+
+# Change of the mean from the previous report year of the same course,
+# study period and category
+def yearly_deltas(dataset):
+    means, _ = row_stats(dataset)
+    series = ('course', 'term', 'period', 'category')
+    order = np.lexsort((dataset['year'],) + tuple(dataset[field] for field in reversed(series)))
+    keys = {field: dataset[field][order] for field in series}
+    year, mean = dataset['year'][order], means[order]
+    # Rows continuing the series of the row before them
+    following = np.ones(max(len(year) - 1, 0), dtype=bool)
+    for key in keys.values():
+        following &= key[1:] == key[:-1]
+    columns = {field: key[1:][following] for field, key in keys.items()}
+    columns.update(year=year[1:][following],
+                   previous_year=year[:-1][following],
+                   mean=mean[1:][following],
+                   delta=(mean[1:] - mean[:-1])[following])
+    return Table(category_names(columns))
+
+# Least squares slope of the mean per year, and the change over the whole
+# span, of every course, study period and category
+def trend_slopes(dataset):
+    columns, inverse = group(dataset, ('course', 'term', 'period', 'category'))
+    count = len(columns['course'])
+    means, _ = row_stats(dataset)
+    years = dataset['year'].astype(float)
+
+    n = np.bincount(inverse, minlength=count).astype(float)
+    sum_x = np.bincount(inverse, years, count)
+    sum_y = np.bincount(inverse, means, count)
+    sum_xy = np.bincount(inverse, years * means, count)
+    sum_xx = np.bincount(inverse, years * years, count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+
+    # Rows of the first and last year of every group, groups are sorted by number
+    order = np.lexsort((years, inverse))
+    starts = np.flatnonzero(np.diff(inverse[order], prepend=-1))
+    first = order[starts]
+    last = order[np.append(starts[1:], len(order)) - 1]
+    columns.update(first_year=dataset['year'][first], last_year=dataset['year'][last],
+                   slope=slope, change=means[last] - means[first], years=n.astype(int))
+    return Table(category_names(columns))
+
+# Rows of the dataset in a category and year range
+def select_span(dataset, category=None, start=None, end=None):
+    mask = np.ones(len(dataset), dtype=bool)
+    if category is not None:
+        mask &= dataset['category'] == category_index(category)
+    if start is not None:
+        mask &= dataset['year'] >= start
+    if end is not None:
+        mask &= dataset['year'] <= end
+    return dataset.take(np.flatnonzero(mask))
+
+# Table ranked on a column, rank 1 is the highest value unless ascending
+def rank(table, column, ascending=False, top=None):
+    ranked = table.sort(column, descending=not ascending)
+    ranked.columns['rank'] = np.arange(1, len(ranked) + 1)
+    return ranked if top is None else ranked.head(top)
+
+# Horizontal bar chart of a ranked table
+def plot_ranking(table, column, title=None):
+    from matplotlib.figure import Figure
+    labels = [str(course) for course in table['course']]
+    if 'category' in table.columns and len(np.unique(table['category'])) > 1:
+        labels = [f"{course} ({category})" for course, category in zip(labels, table['category'])]
+    fig = Figure(figsize=(12, max(4, 0.35 * len(table) + 1)), dpi=100)
+    ax = fig.add_subplot()
+    ax.barh(np.arange(len(table)), table[column])
+    ax.set_yticks(np.arange(len(table)))
+    ax.set_yticklabels(labels)
+    ax.invert_yaxis()
+    ax.set_xlabel(column)
+    ax.grid(True, axis='x')
+    if title:
+        ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+ANALYSES = {'means': weighted_means, 'deltas': yearly_deltas, 'trends': trend_slopes}
+RANK_COLUMNS = {'means': 'mean', 'deltas': 'delta', 'trends': 'slope'}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aggregate stored CEQ results across courses.')
+    parser.add_argument('analysis', choices=list(ANALYSES))
+    parser.add_argument('-c', '--category', type=int, choices=range(len(CATEGORY_KEYS)),
+                        help='category number, ' + ', '.join(f"{i}: {key}" for i, key in enumerate(CATEGORY_KEYS)))
+    parser.add_argument('--start', type=int, help='first year')
+    parser.add_argument('--end', type=int, help='last year')
+    parser.add_argument('--ascending', action='store_true', help='rank the lowest values first')
+    parser.add_argument('--top', type=int, help='only the first rows of the ranking')
+    parser.add_argument('--store', help='results store, the default one by default')
+    parser.add_argument('-o', '--output', default='-', help='CSV output file, - for stdout')
+    parser.add_argument('--plot', help='save a bar chart of the ranking to this file')
+    args = parser.parse_args(argv)
+
+    dataset = select_span(load_store(args.store), args.category, args.start, args.end)
+    if not len(dataset):
+        sys.exit('No stored results match')
+    column = RANK_COLUMNS[args.analysis]
+    table = rank(ANALYSES[args.analysis](dataset), column, args.ascending, args.top)
+    table.to_csv(args.output)
+    if args.plot:
+        plot_ranking(table, column).savefig(args.plot)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from CEQFetcher import Page
+from CEQTool import report_url
+
+# Offline archive of report pages. Every page is compressed on its own and a
+# sorted index of url hashes at the end of the file is binary searched through
+# a memory map, so looking up one report never decompresses the others.
+#
+# Layout: MAGIC, compressed pages, index entries, footer.
+# Compressed page: url, encoding and page bytes separated by newlines.
+# Index entry: url hash, offset, compressed length, flags.
+# Footer: index offset, entry count, INDEX_MAGIC.
+MAGIC = b'CEQARC1\0'
+INDEX_MAGIC = b'CEQIDX1\0'
+ENTRY = struct.Struct('<16sQII')
+FOOTER = struct.Struct('<QQ8s')
+FLAG_MISSING = 1 # The report does not exist, no page is stored
+
+DEFAULT_ARCHIVE_NAME = 'ceq_reports.ceqa'
+
+def url_hash(url):
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.entries = {}
+
+    # Add a page, or a missing report when content is None
+    def add(self, url, content, encoding=None):
+        flags = FLAG_MISSING if content is None else 0
+        header = f"{url}\n{encoding or ''}\n".encode('utf-8')
+        blob = zlib.compress(header + (content or b''), 9)
+        self.entries[url_hash(url)] = (self.file.tell(), len(blob), flags)
+        self.file.write(blob)
+
+    def close(self):
+        index_offset = self.file.tell()
+        for key in sorted(self.entries):
+            self.file.write(ENTRY.pack(key, *self.entries[key]))
+        self.file.write(FOOTER.pack(index_offset, len(self.entries), INDEX_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CEQArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a CEQ archive")
+        self.index_offset, self.count, magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != INDEX_MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} has no archive index")
+
+    def close(self):
+        self.map.close()
+
+    # Index entry of url, found by binary search over the sorted hashes
+    def find(self, url):
+        key = url_hash(url)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = self.index_offset + middle * ENTRY.size
+            entry_key = self.map[position:position + 16]
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return ENTRY.unpack_from(self.map, position)[1:]
+        return None
+
+    # Page of url, None if the archive doesn't have it
+    def lookup(self, url):
+        entry = self.find(url)
+        if entry is None:
+            return None
+        return self.read(*entry)
+
+    def read(self, offset, length, flags):
+        data = zlib.decompress(self.map[offset:offset + length])
+        url, encoding, content = data.split(b'\n', 2)
+        url = url.decode('utf-8')
+        if flags & FLAG_MISSING:
+            return Page(url, 'missing', None, None)
+        return Page(url, 'ok', content, encoding.decode('utf-8') or None)
+
+    # All pages in the archive
+    def pages(self):
+        for i in range(self.count):
+            _, offset, length, flags = ENTRY.unpack_from(self.map, self.index_offset + i * ENTRY.size)
+            yield self.read(offset, length, flags)
+
+    def __len__(self):
+        return self.count
+
+# Archives looked for when none is given: the one bundled with the frozen app
+# (next to the sources when not frozen) and the one in the user's data directory
+def default_archive_paths():
+    bundle_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return [os.path.join(bundle_dir, DEFAULT_ARCHIVE_NAME),
+            os.path.join(os.path.expanduser('~'), '.ceqtool', DEFAULT_ARCHIVE_NAME)]
+
+def open_archive(path=None):
+    for candidate in [path] if path else default_archive_paths():
+        if os.path.exists(candidate):
+            try:
+                return CEQArchive(candidate)
+            except (OSError, ValueError):
+                continue
+    return None
+
+# Pack every page in the HTTP cache, and the missing reports in the results store, into an archive
+def export_archive(path, cache_dir=None, store_path=None):
+    from CEQCache import CEQCache
+    from CEQStore import CEQStore
+    cache = CEQCache(cache_dir)
+    count = 0
+    with ArchiveWriter(path) as writer:
+        for entry in os.scandir(cache.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            cached = cache.get(meta['url'])
+            if cached is not None:
+                writer.add(meta['url'], cached['content'], cached['encoding'])
+                count += 1
+        if store_path is not False:
+            store = CEQStore(store_path)
+            rows = store.conn.execute("SELECT code, term, period, year FROM reports WHERE status = 'missing'")
+            for key in rows:
+                writer.add(report_url(*key), None)
+                count += 1
+            store.close()
+    return count
+
+# Unpack the pages of an archive into the HTTP cache
+def import_archive(path, cache_dir=None):
+    from CEQCache import CEQCache
+    archive = CEQArchive(path)
+    cache = CEQCache(cache_dir)
+    count = 0
+    for page in archive.pages():
+        if page.status == 'ok':
+            cache.put(page.url, page.content, page.encoding, {})
+            count += 1
+    archive.close()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export CEQ report pages to an offline archive.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='pack the HTTP cache into an archive')
+    export.add_argument('archive')
+    export.add_argument('--cache-dir', help='HTTP cache directory')
+    export.add_argument('--no-missing', action='store_true', help='leave out reports known to be missing')
+    unpack = commands.add_parser('import', help='unpack an archive into the HTTP cache')
+    unpack.add_argument('archive')
+    unpack.add_argument('--cache-dir', help='HTTP cache directory')
+    info = commands.add_parser('info', help='show the size of an archive')
+    info.add_argument('archive')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        count = export_archive(args.archive, args.cache_dir, False if args.no_missing else None)
+        print(f"Wrote {count} reports to {args.archive} ({os.path.getsize(args.archive) / 1024:.0f} kB)")
+    elif args.command == 'import':
+        count = import_archive(args.archive, args.cache_dir)
+        print(f"Imported {count} pages into the HTTP cache")
+    else:
+        archive = CEQArchive(args.archive)
+        print(f"{args.archive}: {len(archive)} reports, {os.path.getsize(args.archive) / 1024:.0f} kB")
+        archive.close()
+
+if __name__ == '__main__':
+    main()
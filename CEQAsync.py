@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from CEQFetcher import MISSING_STATUSES, RETRY_STATUSES, backoff_delay, retry_after_seconds
+from CEQParser import PARSERS
+from CEQTool import DEFAULT_BASE_URL, report_url, term_period
+
+# asyncio client for embedding the scraper in async services. Many reports are
+# loaded at once on the running event loop over one aiohttp session, without
+# threads, Qt or matplotlib. aiohttp is only imported when a client is opened.
+#
+#     async with CEQAsyncClient() as client:
+#         records = await client.query([['FMAB20', 'LP1', '2015', '2023']], deadline=30)
+#
+# Records have the format of CEQParser.parse_report, reports that do not exist
+# get status 'missing' and reports that could not be loaded are None.
+class CEQAsyncClient:
+    # concurrency is the number of requests in flight, timeout the limit of
+    # one request. Pages are parsed on the event loop unless an executor is
+    # given, a ProcessPoolExecutor keeps large queries from blocking it.
+    def __init__(self, concurrency=32, timeout=10, retries=3, backoff=0.5, max_backoff=30,
+                 base_url=DEFAULT_BASE_URL, parser='fast', executor=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.base_url = base_url
+        self.parse = PARSERS[parser]
+        self.executor = executor
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError('CEQAsyncClient needs aiohttp, install it with pip install aiohttp') from e
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # Record of one report, None if it could not be loaded
+    async def fetch_report(self, code, term, period, year):
+        import aiohttp
+        url = report_url(code, term, period, year, self.base_url)
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url) as response:
+                        if response.status in MISSING_STATUSES:
+                            return {'status': 'missing', 'values': {}}
+                        if response.status < 400:
+                            content = await response.read()
+                            return await self.parse_page(content, response.charset)
+                        if response.status not in RETRY_STATUSES:
+                            return None
+                        delay = retry_after_seconds(response.headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if attempt < self.retries:
+                await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff, delay))
+        return None
+
+    async def parse_page(self, content, encoding):
+        if self.executor is None:
+            return self.parse(content, encoding)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.parse, content, encoding)
+
+    # Yield (key, record) as reports are loaded. courses are (code, study
+    # period, start year, end year) rows as in CEQTool, key is (code, term,
+    # period, year). After deadline seconds the reports still loading are
+    # cancelled and their keys are left in self.unfinished.
+    async def iter_query(self, courses, deadline=None):
+        keys = report_keys(courses)
+        tasks = {asyncio.ensure_future(self.fetch_report(*key)): key for key in keys}
+        self.unfinished = []
+        end = None if deadline is None else time.monotonic() + deadline
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = None if end is None else max(0.0, end - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.unfinished = [tasks[task] for task in pending]
+                    return
+                for task in done:
+                    yield tasks[task], task.result()
+        finally:
+            # Also reached when the consumer stops early or is cancelled
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    # All records of a query as a dict key -> record
+    async def query(self, courses, deadline=None):
+        return {key: record async for key, record in self.iter_query(courses, deadline)}
+
+# (code, term, period, year) of every report of the courses
+def report_keys(courses):
+    keys = []
+    for code, study_period, start, end in courses:
+        term, period = term_period(study_period)
+        keys.extend((code, term, period, year) for year in range(int(start), int(end) + 1))
+    return keys
+
+# Blocking wrapper for scripts, runs a query on a new event loop
+def load(courses, deadline=None, **client_settings):
+    async def run():
+        async with CEQAsyncClient(**client_settings) as client:
+            return await client.query(courses, deadline)
+    return asyncio.run(run())
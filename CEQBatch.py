@@ -0,0 +1,147 @@
+from datetime import datetime
+import argparse
+import csv
+import json
+import sys
+import time
+
+from CEQExport import FORMATS, export_plots
+from CEQParser import CATEGORY_KEYS
+from CEQProfile import profile_run
+from CEQRateLimiter import limiter_stats
+from CEQTool import CEQTool
+
+FIELDS = ['code', 'term', 'period', 'year', 'status', 'respondents', 'category', 'title', 'value1', 'value2']
+
+# Read (code, period, start, end) rows, a header row is skipped and a missing
+# end year means the current year
+def read_courses(path):
+    input_list = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if len(row) < 3 or not row[0] or row[0].startswith('#'):
+                continue
+            if len(row) < 4 or not row[3]:
+                row = row[:3] + [str(datetime.now().year)]
+            if not (row[2].isdigit() and row[3].isdigit()):
+                continue
+            input_list.append([row[0].upper(), row[1].upper(), row[2], row[3]])
+    return input_list
+
+# CEQTool settings that select every category
+def batch_settings(workers=16, parse_workers=None, http_cache=True, results_store=True,
+                   deadline=None, swedish=False):
+    settings = {'plot_language': 1 if swedish else 0,
+                'max_workers': workers,
+                'http_cache': http_cache,
+                'results_store': results_store,
+                'deadline': deadline}
+    if parse_workers is not None:
+        settings['parse_workers'] = parse_workers
+    for key in CATEGORY_KEYS:
+        settings[key] = 1
+    return settings
+
+# One output row per category on each report, reports without values get a single row
+def report_rows(key, record, titles):
+    code, term, period, year = key
+    row = {'code': code, 'term': term, 'period': period, 'year': year, 'status': record['status'],
+           'respondents': record.get('respondents', 0)}
+    if not record['values']:
+        return [dict(row, category=None, title=None, value1=None, value2=None)]
+    return [dict(row, category=category, title=titles[category], value1=values[0], value2=values[1])
+            for category, values in record['values'].items()]
+
+class RecordWriter:
+    def __init__(self, path, fmt):
+        self.file = open(path, 'w', newline='', encoding='utf-8') if path != '-' else sys.stdout
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.fmt == 'csv':
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scrape CEQ reports for many courses without the GUI.')
+    parser.add_argument('courses', help='CSV file with code, period (LP1-LP4), start year, end year (optional)')
+    parser.add_argument('-o', '--output', default='-', help='output file, - for stdout')
+    parser.add_argument('-f', '--format', choices=['csv', 'jsonl'],
+                        help='output format, guessed from the output file name by default')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='concurrent downloads')
+    parser.add_argument('--parse-workers', type=int, help='parse processes, 0 parses in the download threads')
+    parser.add_argument('--deadline', type=float, help='seconds the whole run may take, partial results are kept')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the HTTP cache')
+    parser.add_argument('--no-store', action='store_true', help='do not use the results store')
+    parser.add_argument('--swedish', action='store_true', help='Swedish category titles')
+    parser.add_argument('--timing-log', help='append per-url stage times to this JSON Lines file')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write CPU and allocation profiles of the run to DIR, also set by CEQ_PROFILE')
+    parser.add_argument('--export', metavar='DIR', help='also save a plot of every course, study period and category in DIR')
+    parser.add_argument('--export-format', default='png',
+                        help='comma separated plot formats: ' + ', '.join(FORMATS))
+    args = parser.parse_args(argv)
+
+    export_formats = [fmt.strip().lower() for fmt in args.export_format.split(',') if fmt.strip()]
+    if any(fmt not in FORMATS for fmt in export_formats):
+        sys.exit(f"Plot formats must be among {', '.join(FORMATS)}")
+    fmt = args.format or ('jsonl' if args.output.endswith(('.jsonl', '.json')) else 'csv')
+    input_list = read_courses(args.courses)
+    if not input_list:
+        sys.exit(f"No course rows found in {args.courses}")
+
+    start = time.perf_counter()
+    settings = batch_settings(args.workers, args.parse_workers, not args.no_cache, not args.no_store,
+                              args.deadline, args.swedish)
+    if args.timing_log:
+        settings['timing_log'] = args.timing_log
+    tool = CEQTool(input_list, settings, run=False)
+    titles = dict(zip(CATEGORY_KEYS, tool.plot_titles))
+    writer = RecordWriter(args.output, fmt)
+    counts = {}
+    try:
+        with profile_run('CEQBatch', args.profile):
+            for url, record in tool.load_records():
+                if record is None:
+                    continue
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+                writer.write(report_rows(tool.url_keys[url], record, titles))
+                if args.export:
+                    tool.data.add_record(tool.url_keys[url], record)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    if args.export:
+        paths = export_plots(tool, args.export, export_formats)
+        print(f"Saved {len(paths)} plots in {args.export} in {time.perf_counter() - start - elapsed:.1f} s",
+              file=sys.stderr)
+
+    total = len(tool.url_dict)
+    summary = [f"{status}: {count}" for status, count in sorted(counts.items())]
+    if tool.skipped:
+        summary.append(f"known missing, not requested: {len(tool.skipped)}")
+    summary.append(f"failed: {len(tool.failed)}")
+    if tool.incomplete:
+        summary.append(f"not loaded before the deadline: {len(tool.unfinished)}")
+    print(f"{total} reports in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.1f} reports/s)", file=sys.stderr)
+    print(', '.join(summary), file=sys.stderr)
+    print(tool.timing.summary(), file=sys.stderr)
+    for host, stats in limiter_stats().items():
+        print(f"{host}: {stats['limit']} concurrent, at most {stats['rate']} requests/s, "
+              f"{stats['throttled']} throttled", file=sys.stderr)
+    for url in sorted(tool.failed):
+        print(f"  failed: {url}", file=sys.stderr)
+    return 1 if tool.failed or tool.incomplete else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
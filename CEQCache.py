@@ -0,0 +1,136 @@
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.ceqtool', 'http_cache')
+
+# On-disk cache of downloaded report pages, keyed by url. Every entry is a
+# body file plus a small json file with the validators, and the least recently
+# used entries are evicted when the cache grows past max_bytes.
+class CEQCache:
+    def __init__(self, directory=None, ttl=6 * 3600, max_bytes=200 * 1024 * 1024):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                        if entry.name.endswith('.html'))
+
+    def paths(self, url):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + '.json', base + '.html'
+
+    # Return cached entry for url, or None if it isn't cached
+    def get(self, url):
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['content'] = f.read()
+        except (OSError, ValueError):
+            return None
+        if 'content_type' not in entry:
+            # Older entries stored the charset requests guessed for pages
+            # without one, let the parser read it from the page instead
+            entry['encoding'] = None
+        # Access time drives the LRU eviction
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return entry
+
+    # Reports from earlier years are final, the current year is revalidated after ttl
+    def is_fresh(self, entry, year=None):
+        if year is not None and int(year) < datetime.now().year:
+            return True
+        return time.time() - entry['stored'] < self.ttl
+
+    # Conditional request headers for revalidating an entry
+    def validators(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # Best effort like get and touch, a full or read-only disk only costs the
+    # next run a download
+    def put(self, url, content, encoding, headers):
+        meta_path, body_path = self.paths(url)
+        meta = {'url': url,
+                'encoding': encoding,
+                'content_type': headers.get('Content-Type'),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'stored': time.time()}
+        with self.lock:
+            try:
+                old_size = os.path.getsize(body_path)
+            except OSError:
+                old_size = 0
+            try:
+                self.write_file(body_path, content)
+                self.write_file(meta_path, json.dumps(meta).encode('utf-8'))
+            except OSError:
+                return
+            self.size += len(content) - old_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    # Entry was revalidated by the server (304), restart its ttl
+    def touch(self, url):
+        meta_path, _ = self.paths(url)
+        with self.lock:
+            try:
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+                meta['stored'] = time.time()
+                self.write_file(meta_path, json.dumps(meta).encode('utf-8'))
+            except (OSError, ValueError):
+                pass
+
+    def write_file(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # Remove least recently used entries until the cache is below 90% of max_bytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                body_path = entry.path[:-5] + '.html'
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path, body_path,
+                                    os.path.getsize(body_path)))
+                except OSError:
+                    continue
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, meta_path, body_path, size in entries:
+            if self.size <= target:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= size
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(('.json', '.html')):
+                    os.remove(entry.path)
+            self.size = 0
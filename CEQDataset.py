@@ -0,0 +1,131 @@
+import numpy as np
+
+from CEQParser import CATEGORY_KEYS
+
+# Column types. category is the index of the category in CATEGORY_KEYS.
+COLUMNS = {'course': 'U10',
+           'term': 'U2',
+           'period': 'U3',
+           'year': np.int16,
+           'category': np.int8,
+           'value1': np.int32,
+           'value2': np.int32,
+           'respondents': np.int32}
+
+# Columnar store of extracted values, one NumPy array per field. Rows keep the
+# course they came from, so courses reported the same year don't overwrite
+# each other, and columns can be aggregated without Python loops.
+class CEQDataset:
+    def __init__(self, capacity=256):
+        self.size = 0
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def __len__(self):
+        return self.size
+
+    # View of the filled part of a column, no data is copied
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def columns(self):
+        return {name: self[name] for name in COLUMNS}
+
+    # Grow the arrays geometrically so appends are amortized O(1)
+    def reserve(self, size):
+        capacity = len(self.arrays['year'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, array in self.arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def append(self, course, term, period, year, category, value1, value2, respondents=0):
+        self.reserve(self.size + 1)
+        i = self.size
+        for name, value in zip(COLUMNS, (course, term, period, year, category_index(category),
+                                         value1, value2, respondents)):
+            self.arrays[name][i] = value
+        self.size += 1
+
+    # Append all categories of a report record
+    def add_record(self, key, record, categories=None):
+        code, term, period, year = key
+        for category, values in record['values'].items():
+            if categories is None or category in categories:
+                self.append(code, term, period, year, category, values[0], values[1],
+                            record.get('respondents', 0))
+
+    # Rows matching every given field, as a new dataset. A field may be given
+    # a single value or a list of values.
+    def select(self, **fields):
+        mask = np.ones(self.size, dtype=bool)
+        for name, value in fields.items():
+            if value is None:
+                continue
+            if name == 'category':
+                value = [category_index(v) for v in value] if isinstance(value, (list, tuple)) \
+                    else category_index(value)
+            if isinstance(value, (list, tuple, set)):
+                mask &= np.isin(self[name], list(value))
+            else:
+                mask &= self[name] == value
+        return self.take(np.flatnonzero(mask))
+
+    def take(self, rows):
+        dataset = CEQDataset(capacity=max(1, len(rows)))
+        for name in COLUMNS:
+            dataset.arrays[name][:len(rows)] = self[name][rows]
+        dataset.size = len(rows)
+        return dataset
+
+    # Categories present, as keys in CATEGORY_KEYS order
+    def categories(self):
+        return [CATEGORY_KEYS[i] for i in np.unique(self['category'])]
+
+    # Year sorted (years, value1, value2) arrays of a category, ready for
+    # plotting. When several rows share a year the last appended one is used.
+    def series(self, category, course=None, term=None, period=None):
+        mask = self['category'] == category_index(category)
+        for name, value in (('course', course), ('term', term), ('period', period)):
+            if value is not None:
+                mask &= self[name] == value
+        rows = np.flatnonzero(mask)
+        years = self['year'][rows]
+        # Stable sort on year keeps append order within a year, the last of each year wins
+        order = np.argsort(years, kind='stable')
+        rows, years = rows[order], years[order]
+        last = np.append(years[1:] != years[:-1], True) if len(years) else np.zeros(0, dtype=bool)
+        rows = rows[last]
+        return self['year'][rows], self['value1'][rows], self['value2'][rows]
+
+    # Rows as dicts, for export
+    def records(self):
+        columns = self.columns()
+        for i in range(self.size):
+            row = {name: columns[name][i].item() for name in COLUMNS}
+            row['category'] = CATEGORY_KEYS[row['category']]
+            yield row
+
+def category_index(category):
+    if isinstance(category, str):
+        return CATEGORY_KEYS.index(category)
+    return int(category)
+
+# Dataset of every report in the results store
+def load_store(store_path=None, **fields):
+    from CEQStore import CEQStore
+    store = CEQStore(store_path)
+    query = """
+        SELECT results.code, results.term, results.period, results.year, category, value1, value2, respondents
+        FROM results JOIN reports USING (code, term, period, year)"""
+    conditions = [f"results.{name} = ?" for name in fields]
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    rows = store.conn.execute(query, list(fields.values())).fetchall()
+    store.close()
+    dataset = CEQDataset(capacity=max(1, len(rows)))
+    for row in rows:
+        dataset.append(*row)
+    return dataset
@@ -0,0 +1,78 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+
+FORMATS = ['png', 'svg', 'pdf']
+DEFAULT_TEMPLATE = '{course}_{period}_{category}_{years}'
+
+# Export jobs are plain data, every process builds and saves the figures itself
+# with the Agg backend, so nothing from matplotlib or Qt crosses process borders
+renderer = None
+
+def init_worker(plot_titles, plot_text, plot_settings):
+    global renderer
+    import matplotlib
+    matplotlib.use('Agg')
+    from CEQRender import CEQRenderer
+    renderer = CEQRenderer(plot_titles, plot_text, plot_settings)
+
+# Save the figure of one series in every format, returns the written paths
+def render_job(job):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    title, years, value1, value2, base_path, formats = job
+    fig, ax = renderer.figure(title)
+    renderer.draw(ax, title, years, value1, value2)
+    FigureCanvasAgg(fig)
+    paths = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        fig.savefig(path, format=fmt)
+        paths.append(path)
+    renderer.release(fig)
+    return paths
+
+# Name usable as a file name on every platform
+def safe_name(text):
+    return re.sub(r'[^\w.-]+', '-', text, flags=re.UNICODE).strip('-')
+
+# period is the study period LP1-LP4
+def file_name(template, course, period, title, years):
+    span = str(years[0]) if years[0] == years[-1] else f"{years[0]}-{years[-1]}"
+    return safe_name(template.format(course=course, period=period, category=title, years=span))
+
+# One job per course, study period and category in the data of a tool
+def export_jobs(tool, directory, formats, template):
+    from CEQTool import study_period
+    jobs = []
+    offerings = set(zip(tool.data['course'].tolist(), tool.data['term'].tolist(), tool.data['period'].tolist()))
+    for course, term, period in sorted(offerings):
+        for category in tool.data.categories():
+            years, value1, value2 = tool.data.series(category, course, term, period)
+            if not len(years):
+                continue
+            title = tool.base_categories[category]
+            name = file_name(template, course, study_period(term, period), title, years.tolist())
+            base_path = os.path.join(directory, name)
+            jobs.append((title, years, value1, value2, base_path, formats))
+    return jobs
+
+# Save a figure of every course, study period and category of a tool in directory, rendered
+# in a pool of processes. progress(done, total) is called as figures are
+# saved. Returns the written paths.
+def export_plots(tool, directory, formats=('png',), template=DEFAULT_TEMPLATE, workers=None, progress=None):
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt}")
+    os.makedirs(directory, exist_ok=True)
+    jobs = export_jobs(tool, directory, list(formats), template)
+    if not jobs:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    paths = []
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(tool.plot_titles, tool.plot_text, tool.plot_settings)) as pool:
+        for done, written in enumerate(pool.map(render_job, jobs), 1):
+            paths.extend(written)
+            if progress is not None:
+                progress(done, len(jobs))
+    return paths
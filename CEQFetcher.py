@@ -0,0 +1,288 @@
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import email.utils
+import math
+import random
+import threading
+import time
+
+from CEQParser import header_charset
+
+# Result of a page request. status is 'ok', 'missing' (the report does not
+# exist), 'error' (the request kept failing after all retries) or 'deadline'
+# (the query deadline passed before the page was loaded)
+Page = namedtuple('Page', ['url', 'status', 'content', 'encoding', 'headers'], defaults=(None,))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MISSING_STATUSES = {404, 410}
+
+# Recent request latencies, used for adaptive timeouts and hedging
+class LatencyTracker:
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, p):
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1)]
+
+class CEQFetcher:
+    # deadline is a time.monotonic() time after which no more requests are
+    # made. timeout is the upper limit of the adaptive per-request timeout.
+    def __init__(self, pool_size=8, retries=3, backoff=0.5, max_backoff=30, timeout=10, cache=None,
+                 cancel=None, deadline=None, hedge=True, min_samples=20, hedge_ratio=0.1, rate_limit=True,
+                 archive=None, timing=None):
+        self.cache = cache
+        self.timing = timing # CEQTiming of wait and download times
+        self.archive = archive
+        self.rate_limit = rate_limit
+        self.pool_size = pool_size
+        self.cancel = cancel
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.hedge_ratio = hedge_ratio
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+        # Room for a hedged duplicate of every request
+        self.session = self.create_session(2 * pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=2 * pool_size) if hedge else None
+
+    # Keep-alive session with a connection pool large enough for all workers
+    def create_session(self, pool_size):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    # Get page from the offline archive or the cache when possible, otherwise
+    # from the server. Earlier years are final, so the archive is used first
+    # for them. For the current year it is the fallback when the server fails.
+    def fetch(self, url, year=None):
+        historical = year is not None and int(year) < datetime.now().year
+        if self.archive is not None and historical:
+            page = self.archive.lookup(url)
+            if page is not None:
+                return page
+        page = self.fetch_cached(url, year)
+        if page.status in ('error', 'deadline') and self.archive is not None:
+            return self.archive.lookup(url) or page
+        return page
+
+    def fetch_cached(self, url, year=None):
+        if self.cache is None:
+            return self.download(url)
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry, year):
+            return Page(url, 'ok', entry['content'], entry['encoding'])
+        page = self.download(url, self.cache.validators(entry))
+        if page.status == 'not_modified':
+            self.cache.touch(url)
+            return Page(url, 'ok', entry['content'], entry['encoding'])
+        if page.status == 'ok':
+            self.cache.put(url, page.content, page.encoding, page.headers)
+        elif page.status in ('error', 'deadline') and entry is not None:
+            # Better a stale copy than nothing
+            return Page(url, 'ok', entry['content'], entry['encoding'])
+        return page
+
+    # Download page, retrying transient failures with exponential backoff
+    def download(self, url, headers=None):
+        import requests
+        for attempt in range(self.retries + 1):
+            if self.cancelled():
+                return Page(url, 'error', None, None)
+            timeout = self.request_timeout()
+            if timeout is None:
+                return Page(url, 'deadline', None, None)
+            delay = None
+            try:
+                response = self.get(url, headers, timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                pass
+            except requests.exceptions.RequestException:
+                return Page(url, 'error', None, None)
+            else:
+                if response.status_code in MISSING_STATUSES:
+                    return Page(url, 'missing', None, None)
+                if response.status_code == 304 and headers:
+                    return Page(url, 'not_modified', None, None)
+                if response.ok:
+                    # requests guesses ISO-8859-1 for text pages without a
+                    # charset, leave those to the page's own declaration
+                    encoding = header_charset(response.headers.get('Content-Type'))
+                    return Page(url, 'ok', response.content, encoding, response.headers)
+                if response.status_code not in RETRY_STATUSES:
+                    return Page(url, 'error', None, None)
+                delay = self.retry_after(response)
+            if attempt < self.retries:
+                self.sleep(self.backoff_delay(attempt, delay))
+        if self.remaining() is not None and self.remaining() <= 0:
+            return Page(url, 'deadline', None, None)
+        return Page(url, 'error', None, None)
+
+    # GET that sends a duplicate request when the first one runs past the p95
+    # latency, and returns whichever response arrives first
+    def get(self, url, headers, timeout):
+        with self.lock:
+            self.requests += 1
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return self.timed_get(url, headers, timeout)
+
+        first = self.executor.submit(self.hedged_get, url, headers, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.allow_hedge():
+            return first.result()
+        second = self.executor.submit(self.hedged_get, url, headers, max(0.1, timeout - delay))
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+        # Both failed, pass on the error of the original request
+        return first.result()
+
+    # timed_get in a thread of the hedging executor
+    def hedged_get(self, url, headers, timeout):
+        from CEQProfile import thread_profile
+        with thread_profile():
+            return self.timed_get(url, headers, timeout)
+
+    # GET through the rate limiter of the host, which learns from the outcome
+    def timed_get(self, url, headers, timeout):
+        import requests
+        from CEQRateLimiter import limiter_for
+        # Start with a slot for every worker, slow start finds the rest
+        limiter = limiter_for(url, limit=self.pool_size) if self.rate_limit else None
+        if limiter is not None and not limiter.acquire(self.remaining(), self.cancel):
+            raise requests.exceptions.Timeout('No request slot before the deadline')
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, headers=headers, timeout=timeout)
+        except requests.exceptions.Timeout:
+            if limiter is not None:
+                limiter.release('overload')
+            raise
+        except Exception:
+            if limiter is not None:
+                limiter.release('error')
+            raise
+        elapsed = time.monotonic() - start
+        self.latency.add(elapsed)
+        if self.timing is not None:
+            # elapsed of the response ends when its headers arrived (time to
+            # first byte, server time included), the rest is the body
+            wait = min(response.elapsed.total_seconds(), elapsed)
+            self.timing.add('wait', wait, url)
+            self.timing.add('download', elapsed - wait, url)
+        if limiter is not None:
+            # Only 429 and 503 say the server is overloaded, other 5xx are errors
+            if response.status_code in (429, 503):
+                limiter.release('overload', self.retry_after(response))
+            elif response.status_code >= 500:
+                limiter.release('error', self.retry_after(response))
+            else:
+                limiter.release('ok')
+        return response
+
+    # Hedge after the p95 latency, once there are enough samples to know it
+    def hedge_delay(self):
+        if not self.hedge or len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(95)
+
+    # Keep the extra load from hedging to a fraction of all requests
+    def allow_hedge(self):
+        with self.lock:
+            if self.hedges >= self.hedge_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    # Timeout adapted to observed latencies and cut to the time left, None once the deadline has passed
+    def request_timeout(self):
+        timeout = self.timeout
+        if len(self.latency) >= self.min_samples:
+            timeout = min(self.timeout, max(2.0, 3 * self.latency.percentile(99)))
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            return None
+        return min(timeout, remaining)
+
+    # Seconds left until the deadline, None without a deadline
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
+
+    # Sleep that is cut short when the run is cancelled, and never past the deadline
+    def sleep(self, delay):
+        remaining = self.remaining()
+        if remaining is not None:
+            delay = max(0.0, min(delay, remaining))
+        if self.cancel is None:
+            time.sleep(delay)
+        else:
+            self.cancel.wait(delay)
+
+    # Delay before retry attempt, see backoff_delay below
+    def backoff_delay(self, attempt, retry_after=None):
+        return backoff_delay(attempt, self.backoff, self.max_backoff, retry_after)
+
+    # Seconds to wait according to the Retry-After header, if any
+    def retry_after(self, response):
+        return retry_after_seconds(response.headers.get('Retry-After'))
+
+# Exponential backoff with jitter, unless the server asked for a delay
+def backoff_delay(attempt, backoff, max_backoff, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, max_backoff)
+    delay = backoff * 2 ** attempt
+    return min(delay + random.uniform(0, delay / 2), max_backoff)
+
+# Seconds of a Retry-After header value, given in seconds or as a date
+def retry_after_seconds(value):
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
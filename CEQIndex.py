@@ -0,0 +1,77 @@
+from datetime import datetime
+import os
+import sqlite3
+import time
+
+from CEQStore import DEFAULT_STORE_PATH
+
+# Index of which (code, term, period, year) reports exist, kept in the same
+# SQLite file as the results store. It is seeded from the reports already in
+# the store and updated after every crawl, so urls of reports known to be
+# missing are never generated again.
+class CEQIndex:
+    def __init__(self, path=None, recheck_age=24 * 3600):
+        self.path = path or DEFAULT_STORE_PATH
+        self.recheck_age = recheck_age
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.create_table()
+
+    def create_table(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS availability (
+                    code TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    exist INTEGER NOT NULL,
+                    checked REAL NOT NULL,
+                    PRIMARY KEY (code, term, period, year))""")
+        if self.conn.execute('SELECT 1 FROM availability LIMIT 1').fetchone() is None:
+            self.build_from_store()
+
+    # Seed the index from reports crawled before it existed
+    def build_from_store(self):
+        has_reports = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports'").fetchone()
+        if not has_reports:
+            return
+        with self.conn:
+            self.conn.execute("""
+                INSERT OR IGNORE INTO availability (code, term, period, year, exist, checked)
+                SELECT code, term, period, year, status != 'missing', fetched_at FROM reports""")
+
+    def close(self):
+        self.conn.close()
+
+    # Record the outcome of crawled reports, items are (key, exists) pairs
+    def update(self, items):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO availability (code, term, period, year, exist, checked)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                [(*key, int(exists), now) for key, exists in items])
+
+    # Keys of reports known not to exist. Misses of the last two years are
+    # checked again after recheck_age, since reports are published late.
+    def known_missing(self, keys):
+        recent = datetime.now().year - 1
+        now = time.time()
+        missing = set()
+        for code, term, period in {key[:3] for key in keys}:
+            rows = self.conn.execute("""
+                SELECT year, checked FROM availability
+                WHERE code = ? AND term = ? AND period = ? AND exist = 0""", (code, term, period))
+            for year, checked in rows:
+                if year >= recent and now - checked > self.recheck_age:
+                    continue
+                missing.add((code, term, period, year))
+        return missing & set(keys)
+
+    # Course codes with at least one existing report, for autocompletion
+    def course_codes(self):
+        rows = self.conn.execute('SELECT DISTINCT code FROM availability WHERE exist = 1 ORDER BY code')
+        return [code for code, in rows]
@@ -0,0 +1,147 @@
+import codecs
+import html
+import re
+
+CATEGORY_KEYS = ['Antal godkända/andel av registrerade',
+                 'God undervisning',
+                 'Tydliga mål',
+                 'Förståelseinriktad examination',
+                 'Lämplig arbetsbelastning',
+                 'Kursen känns angelägen för min utbildning',
+                 'Överlag är jag nöjd med den här kursen']
+
+CEQ_EXISTS = 'CEQ-enkäten fylldes i'
+CEQ_NOT_ANSWERED = 'Inga svar finns. Därför visas ingen sammanfattning av svaren.'
+RESPONDENTS_LABEL = 'Antal svar'
+
+# The CEQ status markers are whole text nodes, as in soup.find(string=...)
+EXISTS_RE = re.compile(r'>\s*' + re.escape(CEQ_EXISTS) + r'\s*<')
+NOT_ANSWERED_RE = re.compile(r'>\s*' + re.escape(CEQ_NOT_ANSWERED) + r'\s*<')
+ROW_RE = re.compile(r'<tr\b[^>]*>(.*?)(?=<tr\b|</tr>|</table>|$)', re.S | re.I)
+CELL_RE = re.compile(r'<td\b[^>]*>(.*?)(?=<td\b|</td>|$)', re.S | re.I)
+TAG_RE = re.compile(r'<[^>]*>')
+NUMBER_RE = re.compile(r'\d+')
+CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w-]+)', re.I)
+BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+
+# Text of a cell the way BeautifulSoup's get_text(strip=True) returns it
+def cell_text(cell):
+    return ''.join(html.unescape(part).strip() for part in TAG_RE.split(cell))
+
+# Charset declared in a Content-Type header, None if it has none. Pages are
+# only decoded with a charset the server actually sent, a guessed one would
+# override the page's own meta charset.
+def header_charset(content_type):
+    match = HEADER_CHARSET_RE.search(content_type or '')
+    return match.group(1) if match else None
+
+# Decode raw page bytes with the given charset, or the one of the page's byte
+# order mark or meta tag
+def decode(content, encoding=None):
+    if encoding is None:
+        encoding = sniff_charset(content)
+    try:
+        return content.decode(encoding, errors='replace')
+    except LookupError:
+        return content.decode('utf-8', errors='replace')
+
+def sniff_charset(content):
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding
+    match = CHARSET_RE.search(content, 0, 2048)
+    return match.group(1).decode('ascii') if match else 'utf-8'
+
+# Value pair of a summary row, None if the cells don't hold one
+def row_values(cells):
+    try:
+        if len(cells) == 2:
+            split = cells[1].split()
+            return [int(split[0]), int(split[2])]
+        return [int(cells[1]), int(cells[2])]
+    except (IndexError, ValueError):
+        return None
+
+# Number of respondents in a row, the first number after the label cell.
+# None if no cell holds the label.
+def row_respondents(cells):
+    for i, cell in enumerate(cells):
+        if RESPONDENTS_LABEL in cell:
+            for value in cells[i + 1:]:
+                match = NUMBER_RE.search(value)
+                if match:
+                    return int(match.group())
+            return 0
+    return None
+
+# Record of a report page: its CEQ status, the number of respondents (0 when
+# the page doesn't say) and the value pairs of every category
+def parse_report(content, encoding=None):
+    text = decode(content, encoding) if isinstance(content, bytes) else content
+    exists = EXISTS_RE.search(text) is not None
+    answered = NOT_ANSWERED_RE.search(text) is None
+    if not exists and '&' in text:
+        # Markers written with character entities
+        unescaped = html.unescape(text)
+        exists = EXISTS_RE.search(unescaped) is not None
+        answered = NOT_ANSWERED_RE.search(unescaped) is None
+
+    values = {}
+    respondents = None
+    remaining = list(CATEGORY_KEYS)
+    for match in ROW_RE.finditer(text):
+        if not remaining and respondents is not None:
+            break
+        row = match.group(1)
+        # Only rows holding a label need to be split into cells
+        probe = html.unescape(row) if '&' in row else row
+        if respondents is None and RESPONDENTS_LABEL in probe:
+            respondents = row_respondents([cell_text(cell) for cell in CELL_RE.findall(row)])
+        for key in remaining:
+            if key in probe:
+                break
+        else:
+            continue
+        cells = [cell_text(cell) for cell in CELL_RE.findall(row)]
+        for key in list(remaining):
+            if any(key in cell for cell in cells):
+                remaining.remove(key)
+                pair = row_values(cells)
+                if pair is not None:
+                    values[key] = pair
+    return {'status': status(exists, answered), 'values': values, 'respondents': respondents or 0}
+
+def status(exists, answered):
+    if not exists:
+        return 'no_ceq'
+    if not answered:
+        return 'no_answers'
+    return 'ok'
+
+# Reference parser built on BeautifulSoup, much slower but kept for comparison
+def parse_report_soup(content, encoding=None):
+    from bs4 import BeautifulSoup
+    if encoding:
+        soup = BeautifulSoup(content.decode(encoding, errors='replace'), 'lxml')
+    else:
+        soup = BeautifulSoup(content, 'lxml')
+    exists = soup.find('h3', string=CEQ_EXISTS) is not None
+    answered = soup.find('em', string=CEQ_NOT_ANSWERED) is None
+
+    respondents = None
+    cell = soup.find('td', string=lambda s: s is not None and RESPONDENTS_LABEL in s)
+    if cell is not None:
+        respondents = row_respondents([td.get_text(strip=True) for td in cell.parent.find_all('td')])
+
+    values = {}
+    for key in CATEGORY_KEYS:
+        cell = soup.find('td', string=lambda s: s is not None and key in s)
+        if cell is None:
+            continue
+        pair = row_values([td.get_text(strip=True) for td in cell.parent.find_all('td')])
+        if pair is not None:
+            values[key] = pair
+    return {'status': status(exists, answered), 'values': values, 'respondents': respondents or 0}
+
+PARSERS = {'fast': parse_report, 'bs4': parse_report_soup}
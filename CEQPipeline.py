@@ -0,0 +1,148 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, as_completed, wait
+import queue
+import threading
+import time
+
+from CEQProfile import thread_profile
+
+# Staged fetch -> parse pipeline. I/O threads download pages into a bounded
+# queue and a process pool parses them, so parsing isn't serialized by the GIL.
+# Only page bytes go to the parse workers and only small records come back.
+# fetch(url) returns a Page or None, parse(content, encoding) must be picklable.
+# Once the time.monotonic() deadline passes, the run stops without waiting for
+# pages still in flight. Parse times are added to timing, a CEQTiming, if given.
+class CEQPipeline:
+    def __init__(self, fetch, parse, io_workers=8, parse_workers=0, queue_size=32, deadline=None,
+                 timing=None):
+        self.fetch = fetch
+        self.parse = parse
+        self.timing = timing
+        self.io_workers = max(1, io_workers)
+        self.parse_workers = parse_workers
+        self.queue_size = max(1, queue_size)
+        self.deadline = deadline
+        self.expired = False
+
+    # Yield (url, record) as records are done, record is None if there was no page
+    def run(self, urls):
+        urls = list(urls)
+        if not urls:
+            return
+        if self.parse_workers:
+            yield from self.run_staged(urls)
+        else:
+            yield from self.run_threaded(urls)
+
+    # Seconds left until the deadline, None without a deadline
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    # Few pages, parse them in the I/O threads and skip the process pool start up
+    def run_threaded(self, urls):
+        executor = ThreadPoolExecutor(max_workers=min(self.io_workers, len(urls)))
+        futures = {executor.submit(self.fetch_and_parse, url): url for url in urls}
+        try:
+            for future in as_completed(futures, timeout=self.remaining()):
+                yield futures[future], future.result()
+        except TimeoutError:
+            self.expired = True
+        finally:
+            # Stragglers are left to finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_and_parse(self, url):
+        with thread_profile():
+            return self.fetch_and_parse_page(url)
+
+    def fetch_and_parse_page(self, url):
+        page = self.fetch(url)
+        if page is None:
+            return None
+        record, seconds = timed_parse(self.parse, page.content, page.encoding)
+        if self.timing is not None:
+            self.timing.add('parse', seconds, url)
+        return record
+
+    def run_staged(self, urls):
+        todo = queue.Queue()
+        for url in urls:
+            todo.put(url)
+        pages = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        # Downloaders block on the full page queue, which holds them back when parsing lags
+        def download():
+            with thread_profile():
+                download_pages()
+
+        def download_pages():
+            while not stop.is_set():
+                try:
+                    url = todo.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    item = (url, self.fetch(url))
+                except Exception as e:
+                    # Raised in the consumer, as run_threaded does, instead
+                    # of leaving it waiting for a page that never comes
+                    item = (url, e)
+                while not stop.is_set():
+                    try:
+                        pages.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        threads = [threading.Thread(target=download, daemon=True)
+                   for _ in range(min(self.io_workers, len(urls)))]
+        for thread in threads:
+            thread.start()
+
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        in_flight = {}
+        received = 0
+        try:
+            while received < len(urls) or in_flight:
+                if self.remaining() == 0:
+                    self.expired = True
+                    return
+                accepting = received < len(urls) and len(in_flight) < self.queue_size
+                if accepting:
+                    try:
+                        url, page = pages.get(timeout=0.05 if in_flight else self.wait_time())
+                    except queue.Empty:
+                        pass
+                    else:
+                        received += 1
+                        if isinstance(page, Exception):
+                            raise page
+                        if page is None:
+                            yield url, None
+                        else:
+                            in_flight[pool.submit(timed_parse, self.parse, page.content, page.encoding)] = url
+                accepting = received < len(urls) and len(in_flight) < self.queue_size
+                done, _ = wait(in_flight, timeout=0 if accepting else self.wait_time(),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    record, seconds = future.result()
+                    if self.timing is not None:
+                        self.timing.add('parse', seconds, url)
+                    yield url, record
+        finally:
+            stop.set()
+            pool.shutdown(wait=not self.expired, cancel_futures=True)
+
+    # Blocking waits wake up in time to notice the deadline
+    def wait_time(self):
+        remaining = self.remaining()
+        return None if remaining is None else min(remaining, 0.5)
+
+# Record of a page and the seconds parsing it took, timed where the parse runs
+def timed_parse(parse, content, encoding):
+    start = time.perf_counter()
+    record = parse(content, encoding)
+    return record, time.perf_counter() - start
@@ -0,0 +1,151 @@
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import cProfile
+import os
+import pstats
+import threading
+import tracemalloc
+
+# Directory profiles are written to when no other is given
+ENV_VAR = 'CEQ_PROFILE'
+
+# Profiles of worker threads of the running profiled() body, None when no
+# profile is taken
+thread_profiles = None
+thread_profiles_lock = threading.Lock()
+
+# Profile directory of a run, None when profiling is off
+def profile_dir(path=None):
+    return path or os.environ.get(ENV_VAR) or None
+
+# Context that profiles its body when a profile directory is set, otherwise a
+# nullcontext so runs without profiling pay nothing
+def profile_run(name, path=None, top=30):
+    directory = profile_dir(path)
+    if directory is None:
+        return nullcontext()
+    return profiled(directory, name, top)
+
+# True while a profiled() body runs, work is then kept in threads that
+# thread_profile() can see instead of worker processes
+def profiling():
+    return thread_profiles is not None
+
+# Profile the CPU time of the calling thread and the memory allocated while
+# the body runs. Writes name-<time>.pstats, a .collapsed file of stacks for
+# flamegraph tools and a .alloc.txt report of the top allocating lines.
+# Worker threads add the work they do inside thread_profile() to the same
+# profile. Since Python 3.12 only one profiler can run at a time, it sees
+# every thread by itself, and when another one is active only the
+# allocations are written.
+@contextmanager
+def profiled(directory, name, top=30):
+    global thread_profiles
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        profile = None
+    with thread_profiles_lock:
+        thread_profiles = []
+    try:
+        yield base
+    finally:
+        if profile is not None:
+            profile.disable()
+        with thread_profiles_lock:
+            workers, thread_profiles = thread_profiles, None
+        after = tracemalloc.take_snapshot()
+        if not tracing:
+            tracemalloc.stop()
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            for worker in workers:
+                stats.add(worker)
+            stats.dump_stats(base + '.pstats')
+            write_collapsed(stats, base + '.collapsed')
+        write_allocations(before, after, base + '.alloc.txt', top)
+
+# Profile the body, run in a worker thread, into the running profiled() call.
+# A nullcontext when nothing is profiled.
+def thread_profile():
+    if thread_profiles is None:
+        return nullcontext()
+    return profiled_thread()
+
+@contextmanager
+def profiled_thread():
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+, the profiler of profiled() already sees this thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        with thread_profiles_lock:
+            if thread_profiles is not None:
+                thread_profiles.append(profile)
+
+def frame_name(func):
+    filename, line, function = func
+    return f"{function} ({os.path.basename(filename)}:{line})"
+
+# Collapsed stacks ("a;b;c microseconds" lines) rebuilt from the call graph.
+# cProfile only records caller -> callee edges, so the time of a function is
+# split over its callers by the share of its cumulative time each caller has.
+# Branches with less than min_share of the total time are left out, which
+# keeps the number of stacks below max_depth / min_share however many paths
+# the call graph has.
+def write_collapsed(stats, path, max_depth=64, min_share=0.001):
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+    lines = {}
+    min_time = stats.total_tt * min_share
+
+    def walk(func, stack, share):
+        _, _, self_time, total_time, _ = stats.stats[func]
+        stack = stack + [frame_name(func)]
+        micros = int(self_time * share * 1e6)
+        if micros > 0:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + micros
+        if len(stack) >= max_depth or total_time <= 0 or total_time * share < min_time:
+            return
+        for callee in callees.get(func, []):
+            if frame_name(callee) in stack:
+                continue
+            callee_total = stats.stats[callee][3]
+            edge_total = stats.stats[callee][4][func][3]
+            if callee_total > 0 and edge_total > 0 and edge_total * share >= min_time:
+                walk(callee, stack, share * edge_total / callee_total)
+
+    for root in roots:
+        walk(root, [], 1.0)
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, micros in sorted(lines.items()):
+            f.write(f"{stack} {micros}\n")
+
+# Lines that allocated the most memory between two snapshots
+def write_allocations(before, after, path, top):
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')]
+    differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    total = sum(difference.size_diff for difference in differences)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Allocated {total / 1024:.1f} KiB in total, top {top} lines:\n")
+        for difference in differences[:top]:
+            f.write(f"{difference}\n")
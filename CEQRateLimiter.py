@@ -0,0 +1,109 @@
+from urllib.parse import urlsplit
+import threading
+import time
+
+# Adaptive concurrency limit for one host under a fixed ceiling on the request
+# rate. Until the first overload (429/503 response or timeout) the limit grows
+# by one per success, doubling every round (slow start). After that it grows by
+# about one per round and is halved on overloads (AIMD), so a crawl settles at
+# the concurrency the server handles. A Retry-After pauses the host instead of
+# cutting the limit, and after quiet seconds without overloads the limiter
+# returns to slow start, so one bad spell doesn't slow down later queries.
+class HostLimiter:
+    def __init__(self, rate=200.0, limit=8, min_limit=1, max_limit=64, cooldown=1.0, quiet=5.0):
+        self.rate = rate # Requests per second at most
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.cooldown = cooldown # Seconds between two decreases
+        self.quiet = quiet
+        self.slow_start = True
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.last_overload = 0.0
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    # Wait for a free slot and a token. Returns False if timeout passed or cancel was set first.
+    def acquire(self, timeout=None, cancel=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if self.in_flight < int(self.limit) and self.tokens >= 1 and now >= self.paused_until:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return True
+                if cancel is not None and cancel.is_set():
+                    return False
+                wait = 0.1
+                if self.tokens < 1:
+                    wait = min(wait, (1 - self.tokens) / self.rate)
+                if now < self.paused_until:
+                    wait = min(wait, self.paused_until - now)
+                if end is not None:
+                    if now >= end:
+                        return False
+                    wait = min(wait, end - now)
+                self.condition.wait(max(wait, 0.001))
+
+    def refill(self, now):
+        # The bucket holds at most one second of requests
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Return the slot. outcome is 'ok', 'overload' (429/503/timeout) or 'error',
+    # errors leave the limit as it is. retry_after pauses the host for that many
+    # seconds.
+    def release(self, outcome, retry_after=None):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == 'ok':
+                self.successes += 1
+                if not self.slow_start and now - self.last_overload >= self.quiet:
+                    self.slow_start = True
+                step = 1 if self.slow_start else 1 / self.limit
+                self.limit = min(self.max_limit, self.limit + step)
+            elif outcome == 'overload':
+                self.throttled += 1
+                self.slow_start = False
+                self.last_overload = now
+                # The server said how long to back off, the pause is enough
+                if not retry_after and now - self.last_decrease >= self.cooldown:
+                    self.last_decrease = now
+                    self.limit = max(self.min_limit, self.limit / 2)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {'rate': round(self.rate, 2),
+                    'limit': int(self.limit),
+                    'in_flight': self.in_flight,
+                    'successes': self.successes,
+                    'throttled': self.throttled,
+                    'slow_start': self.slow_start}
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+# Process-wide limiter of the host of url, kwargs are used when it is created
+def limiter_for(url, **kwargs):
+    host = urlsplit(url).netloc
+    with limiters_lock:
+        if host not in limiters:
+            limiters[host] = HostLimiter(**kwargs)
+        return limiters[host]
+
+# Rate ceiling (requests/s), current concurrency limit and counters per host
+def limiter_stats():
+    with limiters_lock:
+        hosts = list(limiters.items())
+    return {host: limiter.stats() for host, limiter in hosts}
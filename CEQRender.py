@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# Draws the category plots of a CEQTool. Figures are made with the object
+# oriented API, so they are never registered with pyplot and are freed as soon
+# as they are no longer referenced. Labels and styling are worked out once, and
+# redrawing a category only changes the data of its existing artist.
+class CEQRenderer:
+    def __init__(self, plot_titles, plot_text, plot_settings, figsize=(12, 8), dpi=100):
+        self.plot_titles = plot_titles
+        self.plot_text = plot_text
+        self.plot_settings = plot_settings
+        self.figsize = figsize
+        self.dpi = dpi
+        self.artists = {} # axes -> artist of the drawn series
+        self.fonts = {'title': 19, 'label': 17, 'ticks': 15, 'legend': 15}
+
+        # Y label, y limits and series label of every category
+        self.templates = {}
+        for title in plot_titles[1:]:
+            label = self.plot_text[2] if plot_settings.get(title) == 1 else self.plot_text[3]
+            self.templates[title] = (self.plot_text[4], None, label)
+        if plot_settings.get(plot_titles[0]) == 1:
+            self.templates[plot_titles[0]] = (self.plot_text[0], None, None)
+        else:
+            self.templates[plot_titles[0]] = (self.plot_text[1], (0, 100), None)
+
+    # Styled figure for one category
+    def figure(self, title):
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        ax = fig.add_subplot()
+        self.style(ax, title)
+        return fig, ax
+
+    # One figure with a panel for every category, returns the figure and the axes of every title
+    def panels(self, titles, columns=2):
+        columns = min(columns, len(titles))
+        rows = math.ceil(len(titles) / columns)
+        width, height = self.figsize
+        fig = Figure(figsize=(width / 1.5 * columns, height / 1.6 * rows), dpi=self.dpi,
+                     constrained_layout=True)
+        grid = fig.subplots(rows, columns, squeeze=False).ravel()
+        for ax in grid[len(titles):]:
+            ax.set_visible(False)
+        for ax, title in zip(grid, titles):
+            self.style(ax, title, scale=0.75)
+        return fig, dict(zip(titles, grid))
+
+    def style(self, ax, title, scale=1.0):
+        ylabel, ylim, _ = self.templates[title]
+        ax.set_title(title, fontsize=self.fonts['title'] * scale)
+        ax.set_xlabel(self.plot_text[5], fontsize=self.fonts['label'] * scale)
+        ax.set_ylabel(ylabel, fontsize=self.fonts['label'] * scale)
+        ax.tick_params(axis='both', labelsize=self.fonts['ticks'] * scale)
+        if ylim is not None:
+            ax.set_ylim(*ylim)
+        ax.grid(True)
+
+    # Draw the year sorted values of a category, the artist already on ax is
+    # updated instead of adding a new one. Returns the artist.
+    def draw(self, ax, title, years, value1, value2):
+        artist = self.artists.get(ax)
+        if artist is None:
+            artist = self.artists[ax] = self.add_artist(ax, title, years, value1, value2)
+        else:
+            self.update_artist(artist, title, years, value1, value2)
+            ax.relim()
+            ax.autoscale_view()
+        ax.set_xticks(years)
+        return artist
+
+    def add_artist(self, ax, title, years, value1, value2):
+        _, _, label = self.templates[title]
+        if title == self.plot_titles[0]:
+            values = value1 if self.plot_settings[title] == 1 else value2
+            artist, = ax.plot(years, values, marker='o')
+            return artist
+        if self.plot_settings[title] == 1:
+            artist, = ax.plot(years, value1, marker='o', label=label)
+        else:
+            artist = ax.errorbar(years, value1, yerr=value2, fmt='o-', capsize=5, ecolor='red',
+                                 elinewidth=1.5, label=label)
+        ax.legend(fontsize=self.fonts['legend'] * (ax.title.get_fontsize() / self.fonts['title']))
+        return artist
+
+    def update_artist(self, artist, title, years, value1, value2):
+        if title == self.plot_titles[0]:
+            artist.set_data(years, value1 if self.plot_settings[title] == 1 else value2)
+        elif self.plot_settings[title] == 1:
+            artist.set_data(years, value1)
+        else:
+            data_line, caplines, barlinecols = artist.lines
+            low, high = value1 - value2, value1 + value2
+            data_line.set_data(years, value1)
+            caplines[0].set_data(years, low)
+            caplines[1].set_data(years, high)
+            barlinecols[0].set_segments(np.stack([np.column_stack([years, low]),
+                                                  np.column_stack([years, high])], axis=1))
+
+    # Stop tracking the artists of a figure that is no longer used
+    def release(self, fig):
+        for ax in fig.axes:
+            self.artists.pop(ax, None)
@@ -0,0 +1,143 @@
+from datetime import datetime
+import os
+import sqlite3
+import time
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser('~'), '.ceqtool', 'results.sqlite')
+
+# Local SQLite store of extracted report values. A report is keyed by
+# (code, term, period, year) and has a status: 'ok', 'no_ceq' (no CEQ was
+# done), 'no_answers' (CEQ done but not answered) or 'missing' (no report).
+# The value pairs of every category found on the report are kept in results.
+class CEQStore:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_STORE_PATH
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+
+    def create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS reports (
+                    code TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    respondents INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (code, term, period, year))""")
+            # Stores created before respondents were parsed
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(reports)')]
+            if 'respondents' not in columns:
+                self.conn.execute('ALTER TABLE reports ADD COLUMN respondents INTEGER NOT NULL DEFAULT 0')
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    code TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    value1 INTEGER NOT NULL,
+                    value2 INTEGER NOT NULL,
+                    PRIMARY KEY (code, term, period, year, category))""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    code TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (code, term, period))""")
+
+    def close(self):
+        self.conn.close()
+
+    # Stored records for the given report keys. Records that can still change,
+    # see is_stale, are left out once they are older than max_age.
+    def lookup(self, keys, max_age=None):
+        spans = {}
+        for code, term, period, year in keys:
+            span = spans.setdefault((code, term, period), [year, year])
+            span[0] = min(span[0], year)
+            span[1] = max(span[1], year)
+
+        records = {}
+        for (code, term, period), (start, end) in spans.items():
+            rows = self.conn.execute("""
+                SELECT year, status, fetched_at, respondents FROM reports
+                WHERE code = ? AND term = ? AND period = ? AND year BETWEEN ? AND ?""",
+                (code, term, period, start, end))
+            for year, status, fetched_at, respondents in rows:
+                if self.is_stale(year, fetched_at, max_age, status):
+                    continue
+                records[(code, term, period, year)] = {'status': status, 'values': {},
+                                                       'respondents': respondents}
+
+            rows = self.conn.execute("""
+                SELECT year, category, value1, value2 FROM results
+                WHERE code = ? AND term = ? AND period = ? AND year BETWEEN ? AND ?""",
+                (code, term, period, start, end))
+            for year, category, value1, value2 in rows:
+                record = records.get((code, term, period, year))
+                if record is not None:
+                    record['values'][category] = [value1, value2]
+
+        wanted = set(keys)
+        return {key: record for key, record in records.items() if key in wanted}
+
+    # Reports of the current year can still change, and reports of the last
+    # two years may be published after they were found missing, as in CEQIndex
+    def is_stale(self, year, fetched_at, max_age, status=None):
+        current_year = datetime.now().year
+        if max_age is None:
+            return False
+        if year < current_year and not (status == 'missing' and year >= current_year - 1):
+            return False
+        return time.time() - fetched_at > max_age
+
+    # Insert or replace many (key, record) pairs in one transaction
+    def upsert_many(self, items):
+        now = time.time()
+        report_rows = []
+        result_rows = []
+        for key, record in items:
+            report_rows.append((*key, record['status'], now, record.get('respondents', 0)))
+            for category, values in record['values'].items():
+                result_rows.append((*key, category, values[0], values[1]))
+        if not report_rows:
+            return
+        with self.conn:
+            self.conn.executemany("""
+                DELETE FROM results WHERE code = ? AND term = ? AND period = ? AND year = ?""",
+                [row[:4] for row in report_rows])
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO reports (code, term, period, year, status, fetched_at, respondents)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""", report_rows)
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO results (code, term, period, year, category, value1, value2)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""", result_rows)
+
+    def upsert(self, key, record):
+        self.upsert_many([(key, record)])
+
+    # Latest year a report was seen for (code, term, period), None if never synced
+    def watermark(self, code, term, period):
+        row = self.conn.execute("""
+            SELECT year FROM watermarks WHERE code = ? AND term = ? AND period = ?""",
+            (code, term, period)).fetchone()
+        return None if row is None else row[0]
+
+    # Raise watermarks, items are ((code, term, period), year) pairs
+    def advance_watermarks(self, items):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO watermarks (code, term, period, year, synced_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (code, term, period)
+                DO UPDATE SET year = MAX(year, excluded.year), synced_at = excluded.synced_at""",
+                [(*course, year, now) for course, year in items])
@@ -0,0 +1,84 @@
+from datetime import datetime
+import argparse
+import sys
+import time
+
+from CEQBatch import batch_settings, read_courses
+from CEQStore import CEQStore
+from CEQTool import CEQTool, term_period
+
+# Fetch only reports newer than the watermark of each course, the latest year a
+# report was seen for it. With recheck the current year is loaded again even if
+# it is below the watermark, since its report may still change. New values are
+# merged into the results store. courses are (code, study period, start year)
+# rows, start is used for courses that have never been synced.
+def sync(courses, settings, recheck=True):
+    store = CEQStore(settings.get('store_path'))
+    current_year = datetime.now().year
+    input_list = []
+    for code, study_period, start in courses:
+        term, period = term_period(study_period)
+        watermark = store.watermark(code, term, period)
+        first = int(start) if watermark is None else watermark + 1
+        if recheck:
+            first = min(first, current_year)
+        if first <= current_year:
+            input_list.append([code, study_period, str(first), str(current_year)])
+
+    # Stored current year results and cached pages are always revalidated
+    settings = dict(settings, results_store=True)
+    if recheck:
+        settings.update(store_ttl=0, cache_ttl=0)
+    tool = CEQTool(input_list, settings, run=False)
+    found = {}
+    loaded = set()
+    for url, record in tool.load_records():
+        if record is None:
+            continue
+        loaded.add(url)
+        if record['status'] == 'missing':
+            continue
+        code, term, period, year = tool.url_keys[url]
+        found.setdefault((code, term, period), []).append(year)
+
+    # A watermark stays below the first year that failed, missed the deadline
+    # or was cancelled, so the next sync loads that year again
+    not_loaded = {}
+    for url, (code, term, period, year) in tool.url_keys.items():
+        if url not in loaded:
+            course = (code, term, period)
+            not_loaded[course] = min(year, not_loaded.get(course, year))
+    watermarks = []
+    for course, years in found.items():
+        years = [year for year in years if year < not_loaded.get(course, year + 1)]
+        if years:
+            watermarks.append((course, max(years)))
+    store.advance_watermarks(watermarks)
+    store.close()
+    return found, tool
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch CEQ reports newer than the last sync of each course.')
+    parser.add_argument('courses', help='CSV file with code, period (LP1-LP4), start year used before the first sync')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='concurrent downloads')
+    parser.add_argument('--no-recheck', action='store_true', help='do not load the current year again')
+    parser.add_argument('--deadline', type=float, help='seconds the whole sync may take')
+    args = parser.parse_args(argv)
+
+    courses = [row[:3] for row in read_courses(args.courses)]
+    if not courses:
+        sys.exit(f"No course rows found in {args.courses}")
+
+    start = time.perf_counter()
+    settings = batch_settings(args.workers, deadline=args.deadline)
+    found, tool = sync(courses, settings, recheck=not args.no_recheck)
+    elapsed = time.perf_counter() - start
+
+    for (code, term, period), years in sorted(found.items()):
+        print(f"{code} {term} {period}: {', '.join(str(year) for year in sorted(years))}")
+    print(f"Synced {len(courses)} courses, {len(tool.url_dict)} reports checked in {elapsed:.1f} s, "
+          f"{len(tool.failed)} failed", file=sys.stderr)
+    return 1 if tool.failed or tool.incomplete else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
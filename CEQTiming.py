@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+# Order of the stages in summaries. wait is the time until the response
+# headers arrived, which covers connecting, sending and the server's work.
+STAGES = ['load_soup', 'wait', 'download', 'parse', 'CEQ_check', 'extract_yearly_data',
+          'plot_data', 'canvas_draw']
+
+# Timers and counters of one query. Every stage keeps a count and a total,
+# and stages timed for a url are also added to the record of that url. Adding
+# a sample is a lock and a few dict updates, nothing is formatted until a
+# summary or an export is asked for.
+class CEQTiming:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {} # stage -> [count, seconds]
+        self.counters = {} # name -> total
+        self.urls = {} # url -> {stage or counter: total}
+        self.start = time.time()
+
+    # Add seconds spent in a stage, and counters such as bytes=..., for url
+    def add(self, stage, seconds, url=None, **counters):
+        with self.lock:
+            total = self.stages.setdefault(stage, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            if url is not None:
+                record = self.urls.setdefault(url, {})
+                record[stage] = record.get(stage, 0.0) + seconds
+                for name, value in counters.items():
+                    record[name] = record.get(name, 0) + value
+
+    def count(self, name, value=1, url=None):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if url is not None:
+                record = self.urls.setdefault(url, {})
+                record[name] = record.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage, url=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, url)
+
+    def seconds(self, stage):
+        return self.stages.get(stage, [0, 0.0])[1]
+
+    # One line summary for the status bar, e.g. "load_soup 3.2 s (1.4 MB), parse 0.2 s"
+    def summary(self):
+        with self.lock:
+            stages = dict(self.stages)
+            size = self.counters.get('bytes', 0)
+        parts = []
+        for stage in STAGES + sorted(set(stages) - set(STAGES)):
+            if stage not in stages:
+                continue
+            _, seconds = stages[stage]
+            part = f"{stage} {format_seconds(seconds)}"
+            if stage == 'load_soup' and size:
+                part += f" ({size / 1024 / 1024:.1f} MB)"
+            parts.append(part)
+        return ', '.join(parts)
+
+    # Append one JSON line per url, and one with the stage totals, to path
+    def export_jsonl(self, path, query=None):
+        with self.lock:
+            urls = {url: dict(record) for url, record in self.urls.items()}
+            stages = {stage: {'count': count, 'seconds': seconds} for stage, (count, seconds) in self.stages.items()}
+            counters = dict(self.counters)
+        with open(path, 'a', encoding='utf-8') as f:
+            for url, record in urls.items():
+                f.write(json.dumps(dict(record, type='url', url=url, query=query, started=self.start)) + '\n')
+            f.write(json.dumps({'type': 'query', 'query': query, 'started': self.start,
+                                'stages': stages, 'counters': counters}) + '\n')
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms"
+    return f"{seconds:.1f} s"
@@ -1,24 +1,78 @@
+from CEQParser import CATEGORY_KEYS, PARSERS
+import time
+
+# Term and period of the report urls for a study period LP1-LP4
+def term_period(study_period):
+    if study_period in ['LP3', 'LP4']:
+        return 'VT', 'LP1' if study_period == 'LP3' else 'LP2'
+    return 'HT', study_period
+
+# Study period LP1-LP4 of the term and period of a report url
+def study_period(term, period):
+    if term == 'VT':
+        return 'LP3' if period == 'LP1' else 'LP4'
+    return period
+
+DEFAULT_BASE_URL = 'https://www.ceq.lth.se'
+
+# Url of the slutrapport of one course year
+def report_url(code, term, period, year, base_url=DEFAULT_BASE_URL):
+    url_shell = base_url.rstrip('/') + '/rapporter/ceq/{}_slutrapport.html'
+    url_insert = f"{str(year)}_{term}/{period}/{code}_{str(year)}_{term}_{period}"
+    return url_shell.format(url_insert)
+
 class CEQTool:
-    def __init__(self, inputs, settings):
-        self.data = {}
-        self.soup = None
+    # progress(done, total) is called as reports are loaded, and setting the
+    # cancel event stops the run. Pass plot=False to only collect the data, or
+    # run=False to drive the run through iter_records instead.
+    def __init__(self, inputs, settings, plot=True, progress=None, cancel=None, run=True):
+        from CEQDataset import CEQDataset
+        self.data = CEQDataset() # Extracted values of the selected categories
         self.webscrape_done = True
+        self.cancelled = False
+        self.incomplete = False # The query deadline passed before all reports were loaded
+        self.missing = set() # Reports that do not exist
+        self.failed = set() # Reports that could not be downloaded
+        self.unfinished = set() # Reports not loaded before the deadline
+        self.progress = progress
+        self.cancel = cancel
+        self.start_time = time.monotonic()
+        from CEQTiming import CEQTiming
+        self.timing = CEQTiming() # Time spent in every stage of the query
 
         self.apply_settings(settings)
         self.generate_urls(inputs)
+        if run:
+            from CEQProfile import profile_run
+            with profile_run('CEQTool', self.profile_path):
+                self.run(plot)
+
+    # Collect all data and plot it
+    def run(self, plot=True):
+        for _ in self.iter_records():
+            pass
+        if self.webscrape_done and plot and not self.cancelled:
+            self.plot_data()
+
+    # Yield (key, title, values) as each report is loaded, key is the report's
+    # (code, term, period, year). self.data is filled in along the way.
+    def iter_records(self):
         counter = 0 # Check if any webscraping has occured
-        for url, year in self.url_dict.items():
-            self.load_soup(url)
-            if self.soup is None or self.CEQ_check() == -1:
+        for url, record in self.load_records():
+            if record is None or record['status'] == 'missing':
+                continue
+            with self.timing.timer('CEQ_check', url):
+                checked = self.CEQ_check(record)
+            if checked == -1:
                 continue
-            self.extract_yearly_data(year)
+            key = self.url_keys[url]
+            with self.timing.timer('extract_yearly_data', url):
+                added = self.extract_yearly_data(key, record)
+            for title, values in added:
+                yield key, title, values
             self.categories = self.base_categories
             counter += 1
-
-        if counter == 0:
-            self.webscrape_done = False
-        else:
-            self.plot_data()
+        self.webscrape_done = counter > 0
 
     # Select categories
     def apply_settings(self, settings):
@@ -41,18 +95,59 @@ class CEQTool:
                 ['Score', 'Poäng'],
                 ['Year', 'År']]]
 
-        keys = ['Antal godkända/andel av registrerade',
-                'God undervisning',
-                'Tydliga mål',
-                'Förståelseinriktad examination',
-                'Lämplig arbetsbelastning',
-                'Kursen känns angelägen för min utbildning',
-                'Överlag är jag nöjd med den här kursen']
-        
-        self.categories = dict(zip(keys, self.plot_titles)) 
+        self.categories = dict(zip(CATEGORY_KEYS, self.plot_titles)) 
         
         self.plot_settings = {'plot_language': settings['plot_language']}
 
+        # 'figures' plots every category in a figure of its own, 'panels' in one figure
+        self.panels = settings.get('plot_layout', 'figures') == 'panels'
+        self.renderer = None
+
+        # Site the reports are loaded from, a local stand-in server when load testing
+        self.base_url = settings.get('base_url', DEFAULT_BASE_URL)
+
+        # Maximum number of pages downloaded at the same time
+        self.max_workers = max(1, int(settings.get('max_workers', 8)))
+
+        # Seconds the whole query may take, results loaded by then are kept.
+        # Slow requests are hedged with a duplicate after the p95 latency.
+        self.deadline = settings.get('deadline')
+        self.hedge = settings.get('hedge', True)
+
+        # Adapt request rate and concurrency per host to what the server accepts
+        self.rate_limit = settings.get('rate_limit', True)
+
+        # Disk cache of downloaded pages, disabled with 'http_cache': False
+        self.cache_settings = {'http_cache': settings.get('http_cache', True),
+                               'cache_dir': settings.get('cache_dir'),
+                               'cache_ttl': settings.get('cache_ttl', 6 * 3600),
+                               'cache_size': settings.get('cache_size', 200 * 1024 * 1024)}
+
+        # Store of extracted values, disabled with 'results_store': False
+        self.store_settings = {'results_store': settings.get('results_store', True),
+                               'store_path': settings.get('store_path'),
+                               'store_ttl': settings.get('store_ttl', 6 * 3600)}
+
+        # Offline archive of report pages, the bundled one is used by default
+        self.archive_path = settings.get('archive')
+
+        # Index of existing reports, urls of known missing reports are skipped.
+        # It lives in the results store and is off when the store is.
+        self.index_settings = {'availability_index': settings.get('availability_index', True),
+                               'index_recheck': settings.get('index_recheck', 24 * 3600)}
+
+        # Report parser, 'fast' scans the raw page once and 'bs4' uses BeautifulSoup
+        self.parse_report = PARSERS[settings.get('parser', 'fast')]
+
+        # Processes parsing pages, by default a pool is used for large queries only
+        self.parse_workers = settings.get('parse_workers')
+
+        # JSON Lines file the per-url stage times are appended to after every query
+        self.timing_log = settings.get('timing_log')
+
+        # Directory of CPU and allocation profiles of runs, CEQ_PROFILE is used when not set
+        self.profile_path = settings.get('profile')
+
         for key in list(self.categories.keys()):
             if settings[key] == 0:
                 del self.categories[key]
@@ -62,94 +157,250 @@ class CEQTool:
 
     # Construct all urls for each course year
     def generate_urls(self, input_list):
-        url_shell = 'https://www.ceq.lth.se/rapporter/ceq/{}_slutrapport.html'
-        
         self.url_dict= {}
+        self.url_keys = {}
         for inputs in input_list:
             code = inputs[0]
-            period = inputs[1]
-            if period in ['LP3', 'LP4']:
-                term = 'VT'
-                period = 'LP1' if period == 'LP3' else 'LP2'
-            else:
-                term = 'HT'
+            term, period = term_period(inputs[1])
 
             for year in range(int(inputs[2]), int(inputs[3]) + 1):
-                url_insert = f"{str(year)}_{term}/{period}/{code}_{str(year)}_{term}_{period}"
-                url = url_shell.format(url_insert)
+                url = report_url(code, term, period, year, self.base_url)
                 self.url_dict[url] = year
+                self.url_keys[url] = (code, term, period, year)
 
-    # Load page and initiate soup
-    def load_soup(self, url):
-        from bs4 import BeautifulSoup
-        import requests
+        # Don't load reports the availability index knows do not exist, they
+        # are still given by load_records and keep their key in url_keys
+        self.skipped = []
+        index = self.open_index()
+        if index is not None:
+            missing = index.known_missing(list(self.url_keys.values()))
+            index.close()
+            for url, key in self.url_keys.items():
+                if key in missing:
+                    self.skipped.append(url)
+                    del self.url_dict[url]
+
+    # Yield (url, record) of all reports, from the store when possible and
+    # otherwise by loading the pages concurrently over one pooled session.
+    # Reports skipped through the availability index come first as missing.
+    def load_records(self):
+        from CEQFetcher import CEQFetcher
+        from CEQPipeline import CEQPipeline
+        for url in self.skipped:
+            yield url, {'status': 'missing', 'values': {}}
+        store = self.open_store()
+        stored = {}
+        if store is not None:
+            stored = store.lookup([self.url_keys[url] for url in self.url_dict], self.store_settings['store_ttl'])
+        records = {url: stored[self.url_keys[url]] for url in self.url_dict if self.url_keys[url] in stored}
+        self.missing.update(url for url, record in records.items() if record['status'] == 'missing')
+        urls = [url for url in self.url_dict if url not in records]
+        self.report_progress(len(records))
+        yield from records.items()
+        if not urls:
+            if store is not None:
+                store.close()
+            return
+
+        workers = min(self.max_workers, len(urls))
+        deadline = None if self.deadline is None else self.start_time + self.deadline
+        archive = self.open_archive()
+        self.fetcher = CEQFetcher(pool_size=workers, cache=self.open_cache(), cancel=self.cancel,
+                                  deadline=deadline, hedge=self.hedge, rate_limit=self.rate_limit,
+                                  archive=archive, timing=self.timing)
+        pipeline = CEQPipeline(self.load_soup, self.parse_report, io_workers=workers,
+                               parse_workers=self.parse_workers_for(len(urls)), deadline=deadline,
+                               timing=self.timing)
+        fetched = {}
+        results = pipeline.run(urls)
+        try:
+            for url, record in results:
+                if self.cancel is not None and self.cancel.is_set():
+                    self.cancelled = True
+                    break
+                if record is None and url in self.missing:
+                    record = {'status': 'missing', 'values': {}}
+                fetched[url] = record
+                self.report_progress(len(records) + len(fetched))
+                yield url, record
+        finally:
+            results.close()
+            self.fetcher.close()
+            if archive is not None:
+                archive.close()
+            if pipeline.expired:
+                self.unfinished.update(url for url in urls if url not in fetched)
+            self.incomplete = bool(self.unfinished)
+            if store is not None:
+                store.upsert_many([(self.url_keys[url], record)
+                                   for url, record in fetched.items() if record is not None])
+                store.close()
+            index = self.open_index()
+            if index is not None:
+                index.update([(self.url_keys[url], record['status'] != 'missing')
+                              for url, record in fetched.items() if record is not None])
+                index.close()
+            if self.timing_log:
+                try:
+                    self.timing.export_jsonl(self.timing_log)
+                except OSError:
+                    pass
+
+    def report_progress(self, done):
+        if self.progress is not None:
+            self.progress(done, len(self.url_dict))
+
+    def open_cache(self):
+        from CEQCache import CEQCache
+        if not self.cache_settings['http_cache']:
+            return None
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            self.soup = BeautifulSoup(response.text, 'lxml')
-        except requests.exceptions.RequestException:
-            self.soup = None
+            return CEQCache(self.cache_settings['cache_dir'],
+                            ttl=self.cache_settings['cache_ttl'],
+                            max_bytes=self.cache_settings['cache_size'])
+        except OSError:
+            return None
+
+    def open_archive(self):
+        from CEQArchive import open_archive
+        if self.archive_path is False:
+            return None
+        return open_archive(self.archive_path)
+
+    def open_store(self):
+        import sqlite3
+        from CEQStore import CEQStore
+        if not self.store_settings['results_store']:
+            return None
+        try:
+            return CEQStore(self.store_settings['store_path'])
+        except (OSError, sqlite3.Error):
+            return None
+
+    def open_index(self):
+        import sqlite3
+        from CEQIndex import CEQIndex
+        if not (self.index_settings['availability_index'] and self.store_settings['results_store']):
+            return None
+        try:
+            return CEQIndex(self.store_settings['store_path'], self.index_settings['index_recheck'])
+        except (OSError, sqlite3.Error):
+            return None
+
+    # Parse in a process pool only when there are enough pages to pay for starting
+    # it. While profiling, pages are parsed in the profiled download threads.
+    def parse_workers_for(self, page_count):
+        import os
+        from CEQProfile import profiling
+        if profiling():
+            return 0
+        if self.parse_workers is not None:
+            return self.parse_workers
+        if page_count < 50:
+            return 0
+        return os.cpu_count() or 1
+
+    # Load page, None if the report is missing or the download failed
+    def load_soup(self, url):
+        start = time.perf_counter()
+        page = self.fetcher.fetch(url, self.url_dict[url])
+        self.timing.add('load_soup', time.perf_counter() - start, url,
+                        bytes=len(page.content) if page.content else 0)
+        if page.status == 'missing':
+            self.missing.add(url)
+            return None
+        if page.status == 'error':
+            self.failed.add(url)
+            return None
+        if page.status == 'deadline':
+            self.unfinished.add(url)
+            return None
+        return page
 
     # Check if CEQ is done and if there are answers
-    def CEQ_check(self):
-        CEQ_exists = self.soup.find('h3', string='CEQ-enkäten fylldes i')
-        CEQ_answered = self.soup.find('em', string='Inga svar finns. Därför visas ingen sammanfattning av svaren.')
-        if not CEQ_exists or CEQ_answered:
+    def CEQ_check(self, record):
+        if record['status'] != 'ok':
             if 'Antal godkända/andel av registrerade' in self.categories:
                 self.categories = {
                     'Antal godkända/andel av registrerade': self.categories['Antal godkända/andel av registrerade']}
             else: 
                 return -1
 
-    # Extract yearly data from specified tablerows
-    def extract_yearly_data(self, year):
-        for key, title in self.categories.items():
-            row = self.soup.find('td', string=lambda s: key in s).parent
-            cells = [td.get_text(strip=True) for td in row.find_all('td')]
-            if title not in self.data:
-                self.data[title] = {}
-            if len(cells) == 2:
-                values = cells[1].split()
-                self.data[title][year] = [int(values[0]), int(values[2])]
-            else:
-                self.data[title][year] = [int(cells[1]), int(cells[2])]
+    # Extract yearly data from specified tablerows, returns the (title, values) added
+    def extract_yearly_data(self, key, record):
+        added = []
+        for category, title in self.categories.items():
+            if category not in record['values']:
+                continue
+            values = record['values'][category]
+            self.data.append(*key, category, values[0], values[1], record.get('respondents', 0))
+            added.append((title, values))
+        return added
 
     # Plot data
     def plot_data(self):
-        import matplotlib.pyplot as plt
+        with self.timing.timer('plot_data'):
+            self.draw_plots()
+
+    def draw_plots(self):
+        titles = [self.base_categories[category] for category in self.data.categories()]
+        if self.panels:
+            fig, axes = self.get_renderer().panels(titles)
+            for category, title in zip(self.data.categories(), titles):
+                self.draw_series(axes[title], title, *self.data.series(category))
+            self.figs = [fig]
+            return
         self.figs = []
-        for title, yearly_data in self.data.items():
-            years = [*yearly_data]
-            value1 = [yearly_data[year][0] for year in years]
-            value2 = [yearly_data[year][1] for year in years]
-
-            fig, ax = plt.subplots(figsize=(12, 8), dpi=100)
-            if title == self.plot_titles[0]:
-                if self.plot_settings[title] == 1:
-                    ax.plot(years, value1, marker='o')
-                    ax.set_ylabel(self.plot_text[0]) 
-                else:
-                    ax.plot(years, value2, marker='o')
-                    ax.set_ylabel(self.plot_text[1])
-                    ax.set_ylim(0, 100)
-            else:
-                if self.plot_settings[title] == 1:
-                    ax.plot(years, value1, marker='o', label=self.plot_text[2])
-                else:
-                    ax.errorbar(years, value1, yerr=value2, fmt='o-', capsize=5, ecolor='red', elinewidth=1.5, label=self.plot_text[3])
-                ax.set_ylabel(self.plot_text[4])
-                ax.legend()
-                ax.legend(fontsize=15)
-            ax.set_xlabel(self.plot_text[5])
-            ax.set_xticks(years)
-            ax.set_title(title)
-            ax.title.set_fontsize(19)
-            ax.xaxis.label.set_fontsize(17)
-            ax.yaxis.label.set_fontsize(17)
-            ax.tick_params(axis='both', labelsize=15)
-            ax.grid(True)
+        for category, title in zip(self.data.categories(), titles):
+            fig, ax = self.new_figure(title)
+            self.draw_series(ax, title, *self.data.series(category))
             self.figs.append(fig)
 
+    def get_renderer(self):
+        from CEQRender import CEQRenderer
+        if self.renderer is None:
+            self.renderer = CEQRenderer(self.plot_titles, self.plot_text, self.plot_settings)
+        return self.renderer
+
+    # Styled figure for one category
+    def new_figure(self, title):
+        return self.get_renderer().figure(title)
+
+    # Draw the year sorted values of a category, returns the artist. A series
+    # already drawn on ax is updated in place.
+    def draw_series(self, ax, title, years, value1, value2):
+        return self.get_renderer().draw(ax, title, years, value1, value2)
+
+# Adds points to the figures of a running CEQTool as its records arrive,
+# instead of building every figure once all reports are loaded
+class CEQPlotUpdater:
+    def __init__(self, tool):
+        from CEQDataset import CEQDataset
+        self.tool = tool
+        self.data = CEQDataset(capacity=64)
+        self.category_of = {title: category for category, title in tool.base_categories.items()}
+        self.axes = {} # title -> (fig, ax)
+
+    # Add a record, returns the figure and whether it was just created
+    def add(self, key, title, values):
+        with self.tool.timing.timer('plot_data'):
+            return self.draw(key, title, values)
+
+    def draw(self, key, title, values):
+        category = self.category_of[title]
+        self.data.append(*key, category, values[0], values[1])
+        created = not self.axes if self.tool.panels else title not in self.axes
+        if created and self.tool.panels:
+            fig, axes = self.tool.get_renderer().panels(list(self.tool.base_categories.values()))
+            self.axes = {title: (fig, ax) for title, ax in axes.items()}
+        elif created:
+            self.axes[title] = self.tool.new_figure(title)
+        fig, ax = self.axes[title]
+        self.tool.draw_series(ax, title, *self.data.series(category))
+        if not created:
+            fig.canvas.draw_idle()
+        return fig, created
+
 if __name__ == '__main__':
     input_list = [['KBK050', 'LP1', '2016', '2016']]
     settings = {'Antal godkända/andel av registrerade': 0, 
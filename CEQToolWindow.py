@@ -1,17 +1,28 @@
-from PyQt5 import uic
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QWidget, QVBoxLayout, QPushButton, QFileDialog
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QWidget, QVBoxLayout, QPushButton, QFileDialog, QCompleter, QInputDialog, QTabWidget
 from PyQt5.QtGui import QRegExpValidator, QIntValidator
-from PyQt5.QtCore import QRegExp
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5.QtCore import Qt, QRegExp, QObject, QThread, QTimer, QStringListModel, pyqtSignal
 from datetime import datetime
-from CEQTool import CEQTool
+from CEQTool import CEQTool, CEQPlotUpdater
 from CEQToolWindow_ui import Ui_MainWindow
+import argparse
+import multiprocessing
+import os
 import sys
+import threading
+import time
+
+# Plot formats offered by the export dialog
+EXPORT_CHOICES = {'PNG': ['png'], 'SVG': ['svg'], 'PDF': ['pdf'], 'PNG and PDF': ['png', 'pdf']}
+
+# Heavy modules imported in the background once the window is visible
+WARM_UP_MODULES = ['requests', 'numpy', 'CEQDataset', 'CEQRender', 'matplotlib.backends.backend_qt5agg']
 
 class CEQToolWindow(QMainWindow, Ui_MainWindow):
-    def __init__(self):
+    # Queries are profiled into profile_path when it is set
+    def __init__(self, profile_path=None):
         super().__init__()
         self.setupUi(self)
+        self.profile_path = profile_path
 
         # Extra course row widgets are invisible by default
         self.widget_2.setVisible(False)
@@ -23,6 +34,24 @@ class CEQToolWindow(QMainWindow, Ui_MainWindow):
         self.removeCourseButton.clicked.connect(self.remove_course_row)
         self.plotGraphsButton.clicked.connect(self.plot_graphs)
 
+        # Cancel button for a running scrape, only visible while it runs
+        self.cancelButton = QPushButton("Cancel", self.groupBox)
+        self.cancelButton.setVisible(False)
+        self.cancelButton.clicked.connect(self.cancel_scrape)
+        self.horizontalLayout_10.insertWidget(2, self.cancelButton)
+        self.scrape_thread = None
+        self.scrape_worker = None
+
+        # Export of every plot of the last query, enabled once it has data
+        self.exportButton = QPushButton("Export Plots", self.groupBox)
+        self.exportButton.setEnabled(False)
+        self.exportButton.clicked.connect(self.export_plots)
+        self.horizontalLayout_10.insertWidget(3, self.exportButton)
+        self.last_tool = None
+        self.dashboard = None
+        self.export_thread = None
+        self.export_worker = None
+
         # Exclusive and uncheckable checkboxes for Pass rate
         self.amountBox.clicked.connect(lambda: self.exclusive_checkboxes(self.amountBox, self.percentageBox))
         self.percentageBox.clicked.connect(lambda: self.exclusive_checkboxes(self.percentageBox, self.amountBox))
@@ -69,6 +98,36 @@ class CEQToolWindow(QMainWindow, Ui_MainWindow):
             self.start_edit[i].setValidator(QIntValidator(2003, self.current_year))
             self.end_edit[i].setValidator(QIntValidator(2003, self.current_year))
 
+        # Complete course codes from the index of reports found so far
+        self.course_codes = QStringListModel(self)
+        completer = QCompleter(self.course_codes, self)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        for i in range(3):
+            self.course_edit[i].setCompleter(completer)
+
+    # Import the modules needed for plotting without delaying the first window
+    def warm_up(self):
+        def import_modules():
+            import importlib
+            for name in WARM_UP_MODULES:
+                try:
+                    importlib.import_module(name)
+                except ImportError:
+                    pass
+        threading.Thread(target=import_modules, daemon=True).start()
+        self.load_course_codes()
+
+    def load_course_codes(self):
+        import sqlite3
+        from CEQIndex import CEQIndex
+        try:
+            index = CEQIndex()
+            codes = index.course_codes()
+            index.close()
+        except (OSError, sqlite3.Error):
+            return
+        self.course_codes.setStringList(codes)
+
     # Add course code row
     def add_course_row(self):
         if self.visible_rows >= 3:
@@ -169,6 +228,8 @@ class CEQToolWindow(QMainWindow, Ui_MainWindow):
                 cb.append(0)
         
         settings = {'plot_language': cb[0],
+                'deadline': 60,
+                'profile': self.profile_path,
                 'Antal godkända/andel av registrerade': cb[1], 
                 'God undervisning': cb[2],
                 'Tydliga mål': cb[3],
@@ -179,47 +240,301 @@ class CEQToolWindow(QMainWindow, Ui_MainWindow):
         
         return input_list, settings
 
-    # Get data and plot graphs
+    # Get data in a background thread, graphs are plotted when it is done
     def plot_graphs(self):
+        if self.scrape_thread is not None:
+            return
         if self.check_valid_inputs() == -1:
             return
         input_list, settings = self.get_inputs()
-        tool = CEQTool(input_list, settings)
+
+        self.scrape_thread = QThread(self)
+        self.scrape_worker = ScrapeWorker(input_list, settings)
+        self.scrape_worker.moveToThread(self.scrape_thread)
+        self.scrape_thread.started.connect(self.scrape_worker.run)
+        self.scrape_worker.progress.connect(self.show_progress)
+        self.scrape_worker.started.connect(self.scrape_started)
+        self.scrape_worker.record.connect(self.add_record)
+        self.scrape_worker.finished.connect(self.scrape_finished)
+        self.scrape_worker.failed.connect(self.scrape_failed)
+        self.scrape_worker.finished.connect(self.scrape_thread.quit)
+        self.scrape_worker.failed.connect(self.scrape_thread.quit)
+        self.scrape_thread.finished.connect(self.scrape_worker.deleteLater)
+        self.scrape_thread.finished.connect(self.scrape_thread.deleteLater)
+        self.scrape_thread.finished.connect(self.scrape_done)
+
+        self.plotGraphsButton.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        self.cancelButton.setVisible(True)
+        self.statusbar.showMessage("Loading reports...")
+        self.scrape_thread.start()
+
+    # Plots are opened with the first record of their category and then updated
+    def scrape_started(self, tool):
+        self.plot_updater = CEQPlotUpdater(tool)
+        self.panels = tool.panels
+        if self.dashboard is None:
+            self.dashboard = PlotDashboard()
+        self.dashboard.clear()
+        self.dashboard.timing = tool.timing
+
+    def add_record(self, record):
+        key, title, values = record
+        fig, created = self.plot_updater.add(key, title, values)
+        if created:
+            self.dashboard.add_figure(fig, "CEQ" if self.panels else title)
+
+    def show_progress(self, done, total):
+        self.statusbar.showMessage(f"Loading reports {done}/{total}")
+
+    def cancel_scrape(self):
+        if self.scrape_worker is not None:
+            self.scrape_worker.cancel_event.set()
+            self.cancelButton.setEnabled(False)
+            self.statusbar.showMessage("Cancelling...")
+
+    # References are kept until the thread has stopped
+    def scrape_done(self):
+        self.scrape_thread = None
+        self.scrape_worker = None
+        self.plotGraphsButton.setEnabled(True)
+        self.cancelButton.setVisible(False)
+
+    def scrape_finished(self, tool):
+        if tool.cancelled:
+            self.statusbar.showMessage("Cancelled", 5000)
+            return
         if tool.webscrape_done == False:
+            self.statusbar.clearMessage()
             QMessageBox.warning(self, "Warning", "No data has been found. Check inputs for mistakes.")
+            return
+
+        self.load_course_codes()
+        self.last_tool = tool
+        self.exportButton.setEnabled(self.export_thread is None)
+        loaded = len(tool.url_dict) - len(tool.missing | tool.failed | tool.unfinished)
+        message = f"Loaded {loaded} reports"
+        if tool.missing:
+            message += f", {len(tool.missing)} do not exist"
+        if tool.failed:
+            message += f", {len(tool.failed)} could not be downloaded"
+        if tool.incomplete:
+            message += f", incomplete: {len(tool.unfinished)} not loaded before the deadline"
+        summary = tool.timing.summary()
+        if summary:
+            message += f" | {summary}"
+        self.statusbar.showMessage(message)
+
+    # Save every plot of the last query in a directory, rendered in other processes
+    def export_plots(self):
+        if self.last_tool is None or self.export_thread is not None:
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Export Plots")
+        if not directory:
+            return
+        choice, ok = QInputDialog.getItem(self, "Export Plots", "Format:", list(EXPORT_CHOICES), 0, False)
+        if not ok:
+            return
+
+        self.export_thread = QThread(self)
+        self.export_worker = ExportWorker(self.last_tool, directory, EXPORT_CHOICES[choice])
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.show_export_progress)
+        self.export_worker.finished.connect(self.export_finished)
+        self.export_worker.failed.connect(self.export_failed)
+        self.export_worker.finished.connect(self.export_thread.quit)
+        self.export_worker.failed.connect(self.export_thread.quit)
+        self.export_thread.finished.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+        self.export_thread.finished.connect(self.export_done)
+
+        self.exportButton.setEnabled(False)
+        self.statusbar.showMessage("Exporting plots...")
+        self.export_thread.start()
+
+    def show_export_progress(self, done, total):
+        self.statusbar.showMessage(f"Exporting plots {done}/{total}")
+
+    def export_finished(self, directory, count):
+        self.statusbar.showMessage(f"Saved {count} plots in {directory}", 10000)
+
+    def export_failed(self, message):
+        self.statusbar.clearMessage()
+        QMessageBox.warning(self, "Error", f"Exporting the plots failed: {message}")
+
+    def export_done(self):
+        self.export_thread = None
+        self.export_worker = None
+        self.exportButton.setEnabled(self.last_tool is not None)
+
+    def scrape_failed(self, message):
+        self.statusbar.clearMessage()
+        QMessageBox.warning(self, "Error", f"Loading the reports failed: {message}")
+
+    # Stop a running scrape before the window closes
+    def closeEvent(self, event):
+        if self.scrape_thread is not None:
+            self.scrape_worker.cancel_event.set()
+            self.scrape_thread.quit()
+            self.scrape_thread.wait()
+        if self.export_thread is not None:
+            self.export_thread.quit()
+            self.export_thread.wait()
+        super().closeEvent(event)
+
+# Runs CEQTool in a QThread, records are passed to the GUI thread with signals as they arrive
+class ScrapeWorker(QObject):
+    progress = pyqtSignal(int, int)
+    started = pyqtSignal(object)
+    record = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, input_list, settings):
+        super().__init__()
+        self.input_list = input_list
+        self.settings = settings
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        from CEQProfile import profile_run
+        try:
+            with profile_run('CEQTool', self.settings.get('profile')):
+                tool = CEQTool(self.input_list, self.settings, run=False,
+                               progress=self.progress.emit, cancel=self.cancel_event)
+                self.started.emit(tool)
+                for record in tool.iter_records():
+                    self.record.emit(record)
+        except Exception as e:
+            self.failed.emit(str(e))
         else:
-            self.windows = []
-            for fig in tool.figs:
-                win = PlotWindow(fig)
-                self.windows.append(win)
+            self.finished.emit(tool)
+
+# Saves the plots of a CEQTool in a QThread, the rendering itself runs in a process pool
+class ExportWorker(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str, int)
+    failed = pyqtSignal(str)
 
-class PlotWindow(QMainWindow):
-    def __init__(self, fig):
+    def __init__(self, tool, directory, formats):
         super().__init__()
+        self.tool = tool
+        self.directory = directory
+        self.formats = formats
 
-        self.resize(1400, 1000) 
+    def run(self):
+        from CEQExport import export_plots
+        try:
+            paths = export_plots(self.tool, self.directory, self.formats, progress=self.progress.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit(self.directory, len(paths))
+
+# One window with a tab per figure. A figure only gets a canvas while its tab
+# is shown, the canvases of hidden tabs are released with their pixel buffers.
+class PlotDashboard(QMainWindow):
+    def __init__(self):
+        super().__init__()
+
+        self.resize(1400, 1000)
+        self.setWindowTitle("CEQ")
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
 
-        # Add the figure as a canvas
-        canvas = FigureCanvas(fig)
-        layout.addWidget(canvas)
+        self.tabs = QTabWidget()
+        self.tabs.currentChanged.connect(self.show_tab)
+        layout.addWidget(self.tabs)
+        self.figures = [] # Figure of every tab
+        self.canvas = None # Canvas of the shown tab
+        self.timing = None # CEQTiming the canvas draw times are added to
 
         save_button = QPushButton("Save Plot")
-        save_button.clicked.connect(lambda: self.save_plot(fig))
+        save_button.clicked.connect(self.save_plot)
         layout.addWidget(save_button)
 
-        self.show()
+    def add_figure(self, fig, title):
+        self.figures.append(fig)
+        self.tabs.addTab(QWidget(), title)
+        if not self.isVisible():
+            self.show()
+
+    # Remove all tabs and their figures
+    def clear(self):
+        self.release_canvas()
+        self.tabs.blockSignals(True)
+        while self.tabs.count():
+            self.tabs.widget(0).deleteLater()
+            self.tabs.removeTab(0)
+        self.tabs.blockSignals(False)
+        self.figures = []
+
+    def show_tab(self, index):
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        self.release_canvas()
+        if index < 0:
+            return
+        page = self.tabs.widget(index)
+        if page.layout() is None:
+            QVBoxLayout(page).setContentsMargins(0, 0, 0, 0)
+        self.canvas = FigureCanvas(self.figures[index])
+        page.layout().addWidget(self.canvas)
+        start = time.perf_counter()
+        self.canvas.draw()
+        if self.timing is not None:
+            self.timing.add('canvas_draw', time.perf_counter() - start)
+
+    # Detach the canvas of the shown tab, its figure keeps a plain canvas so
+    # updates to it while hidden are no-ops
+    def release_canvas(self):
+        from matplotlib.backend_bases import FigureCanvasBase
+        if self.canvas is None:
+            return
+        FigureCanvasBase(self.canvas.figure)
+        self.canvas.setParent(None)
+        self.canvas.deleteLater()
+        self.canvas = None
 
-    def save_plot(self, fig):
+    def save_plot(self):
+        index = self.tabs.currentIndex()
+        if index < 0:
+            return
         file_path, _ = QFileDialog.getSaveFileName(
             self, "Save Plot", "", "PNG Files (*.png);;All Files (*)")
         if file_path:
-            fig.savefig(file_path)
+            self.figures[index].savefig(file_path)
+
+    # Canvases are only kept while the window is shown
+    def hideEvent(self, event):
+        self.release_canvas()
+        super().hideEvent(event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.canvas is None and self.tabs.currentIndex() >= 0:
+            self.show_tab(self.tabs.currentIndex())
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = CEQToolWindow()
+    # Parse workers of the frozen app start through this entry point
+    multiprocessing.freeze_support()
+    from CEQProfile import profile_dir
+
+    # --profile DIR, or CEQ_PROFILE, profiles every query in its worker thread.
+    # The GUI thread is not profiled, since Python 3.12 a second profiler can't
+    # be started while it runs.
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--profile', metavar='DIR')
+    args, qt_args = arg_parser.parse_known_args()
+    profile_path = profile_dir(args.profile)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = CEQToolWindow(profile_path)
     window.show()
+    QTimer.singleShot(0, window.warm_up)
+
+    # Used by benchmarks/bench_startup.py to time the first window
+    if os.environ.get('CEQ_STARTUP_BENCH'):
+        QTimer.singleShot(0, lambda: (print('window shown', flush=True), app.quit()))
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,11 +1,16 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Offline report archive bundled with the app when present, see CEQArchive.py
+datas = []
+if os.path.exists('ceq_reports.ceqa'):
+    datas.append(('ceq_reports.ceqa', '.'))
 
 a = Analysis(
     ['CEQToolWindow.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=datas,
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,78 @@
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CEQBatch import batch_settings
+from CEQRateLimiter import limiter_stats
+from CEQTool import CEQTool
+from ceq_server import add_fault_arguments, server_from_args
+
+PERIODS = ['LP1', 'LP2', 'LP3', 'LP4']
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1)]
+
+# Load every report of courses x years from base_url once, returns the tool and the seconds it took
+def run_query(base_url, courses, years, args):
+    last_year = 2023
+    input_list = [[f"LOAD{i:02d}", PERIODS[i % 4], str(last_year - years + 1), str(last_year)]
+                  for i in range(courses)]
+    settings = batch_settings(args.workers, args.parse_workers, http_cache=False, results_store=False,
+                              deadline=args.deadline)
+    settings.update(base_url=base_url, availability_index=False, archive=False, hedge=not args.no_hedge,
+                    rate_limit=not args.no_rate_limit)
+    start = time.perf_counter()
+    tool = CEQTool(input_list, settings, run=False)
+    for _ in tool.load_records():
+        pass
+    return tool, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test CEQTool against the local stand-in server.')
+    parser.add_argument('--url', help='base url of a running stand-in server, one is started by default')
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3, help='queries to run one after another')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='concurrent downloads')
+    parser.add_argument('--parse-workers', type=int, help='parse processes, 0 parses in the download threads')
+    parser.add_argument('--deadline', type=float, help='seconds every query may take')
+    parser.add_argument('--no-hedge', action='store_true', help='do not hedge slow requests')
+    parser.add_argument('--no-rate-limit', action='store_true', help='do not adapt the request rate')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = server_from_args(args)
+        server.start()
+        base_url = server.base_url
+
+    print(f"{args.courses} courses x {args.years} years from {base_url}, {args.workers} workers")
+    for i in range(args.repeat):
+        tool, elapsed = run_query(base_url, args.courses, args.years, args)
+        latencies = [record['load_soup'] for record in tool.timing.urls.values() if 'load_soup' in record]
+        total = len(tool.url_dict)
+        loaded = total - len(tool.failed) - len(tool.unfinished)
+        print(f"query {i + 1}: {total} reports in {elapsed:.2f} s, {loaded / elapsed:.1f} reports/s | "
+              f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.0f} ms, max {max(latencies, default=0) * 1000:.0f} ms | "
+              f"missing {len(tool.missing)}, failed {len(tool.failed)}, unfinished {len(tool.unfinished)}, "
+              f"hedged {tool.fetcher.hedges}")
+
+    for host, stats in limiter_stats().items():
+        print(f"{host}: {stats['limit']} concurrent, at most {stats['rate']} requests/s, "
+              f"{stats['throttled']} throttled")
+    if server is not None:
+        print('server: ' + ', '.join(f"{key}: {value}" for key, value in sorted(server.counts.items(), key=str)))
+        server.shutdown()
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
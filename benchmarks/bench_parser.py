@@ -0,0 +1,49 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CEQParser import PARSERS
+
+# Parse every saved page repeatedly and return pages per CPU-second
+def bench(parser, pages, min_time):
+    parsed = 0
+    start = time.process_time()
+    while True:
+        for content in pages:
+            parser(content)
+        parsed += len(pages)
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return parsed / elapsed
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare the report parsers on saved slutrapport pages.')
+    arg_parser.add_argument('pages', help='directory with saved .html pages')
+    arg_parser.add_argument('--min-time', type=float, default=2.0, help='CPU seconds per parser')
+    args = arg_parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.pages, '**', '*.html'), recursive=True))
+    if not paths:
+        sys.exit(f"No .html pages found in {args.pages}")
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+
+    # Both parsers have to agree before their speed is worth comparing
+    for path, content in zip(paths, pages):
+        fast = PARSERS['fast'](content)
+        reference = PARSERS['bs4'](content)
+        if fast != reference:
+            print(f"Mismatch in {path}:\n  fast: {fast}\n  bs4:  {reference}")
+
+    results = {name: bench(parser, pages, args.min_time) for name, parser in PARSERS.items()}
+    for name, rate in results.items():
+        print(f"{name:>5}: {rate:10.1f} pages/s")
+    print(f"speedup: {results['fast'] / results['bs4']:.1f}x")
+
+if __name__ == '__main__':
+    main()
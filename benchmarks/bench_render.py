@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CEQParser import CATEGORY_KEYS
+from CEQTool import CEQTool
+
+# CEQTool with every category selected and synthetic values for years
+def make_tool(years, errorbars):
+    settings = {'plot_language': 0, 'availability_index': False, 'results_store': False}
+    for key in CATEGORY_KEYS:
+        settings[key] = 2 if errorbars else 1
+    tool = CEQTool([], settings, run=False)
+    for year in range(2024 - years, 2024):
+        for i, key in enumerate(CATEGORY_KEYS):
+            tool.data.append('BENCH1', 'HT', 'LP1', year, key, 10 + i + year % 7, 20 + year % 5, 30)
+    return tool
+
+# Milliseconds per figure to build and draw the plots of a tool
+def bench_plot(tool, panels, repeat):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    tool.panels = panels
+    start = time.perf_counter()
+    figures = 0
+    for _ in range(repeat):
+        tool.renderer = None
+        tool.plot_data()
+        for fig in tool.figs:
+            FigureCanvasAgg(fig).draw()
+        figures += len(tool.data.categories())
+    return (time.perf_counter() - start) / figures * 1000
+
+# Milliseconds per figure to update the series of existing figures and redraw them
+def bench_update(tool, repeat):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    tool.panels = False
+    tool.renderer = None
+    tool.plot_data()
+    canvases = [FigureCanvasAgg(fig) for fig in tool.figs]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for category, fig, canvas in zip(tool.data.categories(), tool.figs, canvases):
+            tool.draw_series(fig.axes[0], tool.base_categories[category], *tool.data.series(category))
+            canvas.draw()
+    return (time.perf_counter() - start) / (repeat * len(canvases)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Time rendering of the category plots.')
+    parser.add_argument('--years', type=int, default=10, help='years per series')
+    parser.add_argument('--repeat', type=int, default=5, help='times every plot is rendered')
+    parser.add_argument('--mean-only', action='store_true', help='plot means without error bars')
+    args = parser.parse_args()
+
+    tool = make_tool(args.years, not args.mean_only)
+    print(f"new figures:  {bench_plot(tool, False, args.repeat):.1f} ms per figure")
+    print(f"panels:       {bench_plot(tool, True, args.repeat):.1f} ms per category")
+    print(f"update:       {bench_update(tool, args.repeat):.1f} ms per figure")
+
+if __name__ == '__main__':
+    main()
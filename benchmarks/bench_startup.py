@@ -0,0 +1,71 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules whose import time is always reported
+WATCHED = ['PyQt5.QtWidgets', 'CEQToolWindow_ui', 'CEQTool', 'requests', 'bs4',
+           'matplotlib', 'matplotlib.pyplot', 'matplotlib.backends.backend_qt5agg']
+
+# Import time per module in ms, from python -X importtime
+def import_times(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times
+
+# Seconds from starting the GUI process until its main window is shown
+def time_to_window():
+    env = dict(os.environ, CEQ_STARTUP_BENCH='1')
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'CEQToolWindow.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.strip() == 'window shown':
+            elapsed = time.perf_counter() - start
+            break
+    else:
+        process.wait()
+        sys.exit('The main window was never shown')
+    process.wait()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure start up time of the GUI.')
+    parser.add_argument('--runs', type=int, default=5, help='GUI starts to time')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--budget', type=float, help='fail if the median time to window exceeds this many seconds')
+    args = parser.parse_args()
+
+    times = import_times('CEQToolWindow')
+    print('Import time of CEQToolWindow (ms, self / cumulative):')
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_ms, cumulative_ms) in slowest:
+        print(f"  {name:<45} {self_ms:8.1f} {cumulative_ms:8.1f}")
+    for name in WATCHED:
+        if name in times:
+            print(f"  {name:<45} {times[name][0]:8.1f} {times[name][1]:8.1f}")
+        else:
+            print(f"  {name:<45} {'not imported at start up':>17}")
+
+    runs = sorted(time_to_window() for _ in range(args.runs))
+    median = runs[len(runs) // 2]
+    print(f"Time to first window: median {median:.3f} s, min {runs[0]:.3f} s, max {runs[-1]:.3f} s")
+    if args.budget is not None and median > args.budget:
+        print(f"Over the start up budget of {args.budget:.3f} s")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+from datetime import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from CEQArchive import ArchiveWriter
+from CEQBatch import batch_settings
+from CEQParser import parse_report
+from CEQTool import CEQTool, report_url
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Offline settings selecting every category, nothing is read from or written to
+# the user's cache, store or index
+def offline_settings(archive=False):
+    settings = batch_settings(workers=8, http_cache=False, results_store=False)
+    settings.update(availability_index=False, archive=archive)
+    return settings
+
+def load_fixtures():
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+        with open(path, 'rb') as f:
+            pages[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return pages
+
+# Pages per second through parse, CEQ_check and extract_yearly_data
+def bench_extract(pages, min_time):
+    tool = CEQTool([], offline_settings(), run=False)
+    results = {}
+    for name, content in list(pages.items()) + [('all', None)]:
+        contents = list(pages.values()) if content is None else [content]
+        done = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            for content in contents:
+                record = parse_report(content)
+                if tool.CEQ_check(record) != -1:
+                    tool.extract_yearly_data(('BENCH1', 'HT', 'LP1', 2000), record)
+                tool.categories = tool.base_categories
+            done += len(contents)
+        results[name] = done / (time.perf_counter() - start)
+    return results
+
+# Seconds for whole CEQTool queries served from an archive of the fixtures
+def bench_end_to_end(pages, years, repeat):
+    try:
+        import requests # noqa: F401, the fetcher needs it even when nothing is downloaded
+    except ImportError:
+        return None
+    contents = list(pages.values())
+    last_year = datetime.now().year - 1
+    input_list = [['BENCH1', 'LP1', str(last_year - years + 1), str(last_year)]]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.ceqa')
+        with ArchiveWriter(path) as writer:
+            for i, year in enumerate(range(last_year - years + 1, last_year + 1)):
+                # The charset is read from the page, as for downloads without one
+                writer.add(report_url('BENCH1', 'HT', 'LP1', year), contents[i % len(contents)])
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            CEQTool(input_list, offline_settings(path), plot=False)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {'reports': years, 'median': timings[len(timings) // 2], 'min': timings[0]}
+
+# Milliseconds per figure for plot_data and drawing the figures on the Agg canvas
+def bench_plot(years, repeat):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    tool = CEQTool([], offline_settings(), run=False)
+    pages = load_fixtures()
+    record = parse_report(pages['report_ok'])
+    for year in range(2024 - years, 2024):
+        tool.extract_yearly_data(('BENCH1', 'HT', 'LP1', year), record)
+    plot_time = draw_time = 0.0
+    for _ in range(repeat):
+        tool.renderer = None
+        start = time.perf_counter()
+        tool.plot_data()
+        plot_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for fig in tool.figs:
+            FigureCanvasAgg(fig).draw()
+        draw_time += time.perf_counter() - start
+    figures = repeat * len(tool.figs)
+    return {'plot_data_ms': plot_time / figures * 1000, 'draw_ms': draw_time / figures * 1000}
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+# Flat name -> value pairs of a result, for comparisons
+def flatten(result, prefix=''):
+    values = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            values[prefix + key] = value
+    return values
+
+def compare(result, path):
+    with open(path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous['commit']} ({os.path.basename(path)}):")
+    old, new = flatten(previous['results']), flatten(result['results'])
+    for name in sorted(set(old) & set(new)):
+        if old[name]:
+            print(f"  {name:40} {old[name]:12.2f} -> {new[name]:12.2f} ({new[name] / old[name] - 1:+.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parsing, whole queries and plotting on the saved fixtures.')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds per parse measurement')
+    parser.add_argument('--years', type=int, default=20, help='reports per query and years per plot')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of queries and plots')
+    parser.add_argument('--compare', help='result file to compare with, the latest other one by default')
+    parser.add_argument('--no-save', action='store_true', help=f"do not store the result in {RESULTS}")
+    args = parser.parse_args()
+
+    pages = load_fixtures()
+    if not pages:
+        sys.exit(f"No fixtures found in {FIXTURES}")
+
+    result = {'commit': git_commit(),
+              'date': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'results': {'extract_pages_per_s': bench_extract(pages, args.min_time),
+                          'end_to_end_s': bench_end_to_end(pages, args.years, args.repeat),
+                          'plot': bench_plot(args.years, args.repeat)}}
+
+    for name, value in sorted(flatten(result['results']).items()):
+        print(f"{name:40} {value:12.2f}")
+    if result['results']['end_to_end_s'] is None:
+        print('end_to_end_s skipped, requests is not installed')
+
+    previous = sorted(glob.glob(os.path.join(RESULTS, '*.json')), key=os.path.getmtime)
+    path = os.path.join(RESULTS, f"{result['commit']}.json")
+    previous = [p for p in previous if os.path.abspath(p) != os.path.abspath(path)]
+    if args.compare or previous:
+        compare(result, args.compare or previous[-1])
+    if not args.no_save:
+        os.makedirs(RESULTS, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved {path}")
+
+if __name__ == '__main__':
+    main()
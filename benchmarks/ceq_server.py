@@ -0,0 +1,187 @@
+import argparse
+import glob
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+# Local stand-in for www.ceq.lth.se that serves the slutrapport url scheme of
+# CEQTool.generate_urls, with injected latency and faults. Whether a report
+# exists and which page it gets are derived from a hash of its path, so every
+# run and every retry sees the same site.
+PATH_RE = re.compile(r'^/rapporter/ceq/(\d{4})_(HT|VT)/(LP\d)/(\w+)_(\d{4})_(HT|VT)_(LP\d)_slutrapport\.html$')
+
+SCALES = ['God undervisning', 'Tydliga mål', 'Förståelseinriktad examination', 'Lämplig arbetsbelastning',
+          'Kursen känns angelägen för min utbildning', 'Överlag är jag nöjd med den här kursen']
+
+# Server behaviour, all rates are fractions of requests
+class Faults:
+    def __init__(self, latency=0.05, jitter=0.5, missing_rate=0.1, error_rate=0.0, burst_every=0.0,
+                 burst_length=0.0, burst_status=503, retry_after=None, stall_rate=0.0, stall_time=30.0,
+                 seed=0):
+        self.latency = latency # Median response time in seconds
+        self.jitter = jitter # Sigma of the lognormal latency distribution, 0 for a fixed latency
+        self.missing_rate = missing_rate # Reports answered with 404
+        self.error_rate = error_rate # Random 500 responses outside bursts
+        self.burst_every = burst_every # Seconds between the starts of error bursts, 0 for none
+        self.burst_length = burst_length # Seconds every burst lasts
+        self.burst_status = burst_status # 503, or 429 for rate limiting bursts
+        self.retry_after = retry_after # Retry-After header of burst responses
+        self.stall_rate = stall_rate # Requests that hang for stall_time before any response
+        self.stall_time = stall_time
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def delay(self):
+        with self.lock:
+            if self.jitter <= 0:
+                return self.latency
+            return self.random.lognormvariate(0, self.jitter) * self.latency
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def in_burst(self):
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_length
+
+# Page bodies of the reports, fixtures if given, otherwise synthetic pages
+class Pages:
+    def __init__(self, directory=None):
+        self.fixtures = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.html'))) if directory else []:
+            with open(path, 'rb') as f:
+                self.fixtures.append(f.read())
+
+    def page(self, digest, code, year, term, period):
+        if self.fixtures:
+            return self.fixtures[digest[1] % len(self.fixtures)]
+        rng = random.Random(digest)
+        registered = rng.randint(20, 300)
+        answers = rng.randint(0, registered // 2)
+        rows = ''.join(f"<tr><td>{label}</td><td>{rng.randint(-60, 80)}</td><td>{rng.randint(15, 50)}</td></tr>\n"
+                       for label in SCALES)
+        body = (f"<table>\n<tr><td>Antal registrerade</td><td>{registered}</td></tr>\n"
+                f"<tr><td>Antal svar</td><td>{answers}</td></tr>\n</table>\n"
+                f"<table>\n<tr><td>Antal godkända/andel av registrerade</td>"
+                f"<td>{int(registered * 0.7)} / 70</td></tr>\n</table>\n")
+        if answers:
+            body += f"<h3>CEQ-enkäten fylldes i</h3>\n<table>\n{rows}</table>\n"
+        else:
+            body += "<h3>CEQ-enkäten fylldes i</h3>\n<em>Inga svar finns. Därför visas ingen sammanfattning av svaren.</em>\n"
+        return (f"<html><head><meta charset=\"utf-8\"><title>{code} {year} {term} {period}</title></head>\n"
+                f"<body>\n<h1>{code}</h1>\n{body}</body></html>\n").encode('utf-8')
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        faults = server.faults
+        if faults.stall_rate and faults.chance(faults.stall_rate):
+            server.count('stalled')
+            time.sleep(faults.stall_time)
+        time.sleep(faults.delay())
+
+        if faults.in_burst():
+            headers = {} if faults.retry_after is None else {'Retry-After': str(faults.retry_after)}
+            return self.reply(faults.burst_status, b'', headers)
+        if faults.error_rate and faults.chance(faults.error_rate):
+            return self.reply(500, b'')
+
+        match = PATH_RE.match(self.path.split('?')[0])
+        digest = hashlib.sha1(self.path.encode('utf-8')).digest()
+        # The same fraction of reports is missing in every run
+        if match is None or int.from_bytes(digest[:4], 'big') / 2 ** 32 < faults.missing_rate:
+            return self.reply(404, b'Not found')
+        year, term, period, code = match.group(1, 2, 3, 4)
+        content = server.pages.page(digest, code, year, term, period)
+        etag = '"' + hashlib.sha1(content).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, b'', {'ETag': etag})
+        self.reply(200, content, {'Content-Type': 'text/html; charset=utf-8', 'ETag': etag})
+
+    def reply(self, status, content, headers=None):
+        self.server.count(status)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if content:
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, faults=None, pages=None):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.faults = faults or Faults()
+        self.pages = pages or Pages()
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key):
+        with self.counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    # Serve from a daemon thread, returns the thread
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.05, help='median response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.5, help='sigma of the lognormal latency, 0 for fixed')
+    parser.add_argument('--missing-rate', type=float, default=0.1, help='share of reports that do not exist')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of random 500 responses')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='seconds between error bursts')
+    parser.add_argument('--burst-length', type=float, default=0.0, help='seconds every error burst lasts')
+    parser.add_argument('--burst-status', type=int, default=503, choices=[429, 500, 502, 503, 504])
+    parser.add_argument('--retry-after', type=int, help='Retry-After seconds sent with burst responses')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='share of requests that hang')
+    parser.add_argument('--stall-time', type=float, default=30.0, help='seconds a stalled request hangs')
+    parser.add_argument('--pages', help='directory of pages to serve, such as benchmarks/fixtures, synthetic pages by default')
+    parser.add_argument('--seed', type=int, default=0)
+
+def server_from_args(args, port=0):
+    faults = Faults(args.latency, args.jitter, args.missing_rate, args.error_rate, args.burst_every,
+                    args.burst_length, args.burst_status, args.retry_after, args.stall_rate, args.stall_time,
+                    args.seed)
+    return StandInServer(port, faults, Pages(args.pages))
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve CEQ report urls locally with injected latency and faults.')
+    parser.add_argument('--port', type=int, default=8000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.port)
+    print(f"Serving on {server.base_url}, set 'base_url' in the CEQTool settings to use it", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(', '.join(f"{key}: {value}" for key, value in sorted(server.counts.items(), key=str)),
+              file=sys.stderr)
+
+if __name__ == '__main__':
+    main()